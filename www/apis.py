@@ -6,6 +6,11 @@ JSON API definition: JSON API 定义，异常信息分类及处理。
 
 import json, logging, inspect, functools
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 #分页信息类：返回一个存储分页信息的str：
 class Page(object):
@@ -62,6 +67,75 @@ class Page(object):
     __repr__ = __str__
 
 
+#JSON编码：安装了orjson时使用orjson，否则使用标准库json；
+#Model是dict的子类，两者都直接编码；Page等其他对象按__dict__编码：
+def _default(o):
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    return o.__dict__
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        ' encode obj to JSON bytes (utf-8). '
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+else:
+    #“ensure_ascii=False”：非ASCII字符不转换，原样输出：
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj):
+        ' encode obj to JSON bytes (utf-8). '
+        return _encoder.encode(obj).encode('utf-8')
+
+#按请求的字段(?fields=)投影JSON结果：
+#   - 普通dict(如dict(page=..., blogs=[...]))为包装结果，其中的列表逐项投影，其他值(分页信息等)不变；
+#   - dict的子类(Model)为数据项，只保留fields中的键及主键id；
+#   - 列表逐项投影。
+def project(obj, fields):
+    if isinstance(obj, (list, tuple)):
+        return [project(o, fields) for o in obj]
+    if type(obj) is dict:
+        return {k: [project(o, fields) for o in v] if isinstance(v, (list, tuple)) else v for k, v in obj.items()}
+    if isinstance(obj, dict):
+        return {k: v for k, v in obj.items() if k in fields or k == 'id'}
+    return obj
+
+#判断是否包含较大的列表(顶层或dict的值中有不少于threshold个元素的列表)，较大的结果分段编码并以chunked方式发送：
+def has_large_list(obj, threshold):
+    if isinstance(obj, (list, tuple)):
+        return len(obj) >= threshold
+    if isinstance(obj, dict):
+        return any(isinstance(v, (list, tuple)) and len(v) >= threshold for v in obj.values())
+    return False
+
+#分段编码JSON：顶层或dict的值中的列表每batch个元素编码一次，其余部分一次编码；返回bytes的生成器：
+def iter_dumps(obj, batch=100):
+    if isinstance(obj, (list, tuple)):
+        yield from _iter_array(obj, batch)
+    elif isinstance(obj, dict):
+        sep = b'{'
+        for k, v in obj.items():
+            key = dumps(k if isinstance(k, str) else str(k))
+            if isinstance(v, (list, tuple)) and len(v) > batch:
+                yield sep + key + b':'
+                yield from _iter_array(v, batch)
+            else:
+                yield sep + key + b':' + dumps(v)
+            sep = b','
+        yield b'{}' if sep == b'{' else b'}'
+    else:
+        yield dumps(obj)
+
+def _iter_array(items, batch):
+    sep = b'['
+    for i in range(0, len(items), batch):
+        #去掉每段的'[]'后拼接：
+        yield sep + dumps(list(items[i:i + batch]))[1:-1]
+        sep = b','
+    yield b'[]' if sep == b'[' else b']'
+
+
 #定义API异常基类：
 class APIError(Exception):
     '''
@@ -6,9 +6,16 @@ Http服务器
 
 import logging; logging.basicConfig(level=logging.INFO)
 
-import asyncio, os, json, time
+import asyncio, os, re, time, signal, tempfile, functools
 from datetime import datetime
 
+#导入prefork.py文件
+import prefork
+#平滑重启(execve)后尽早接管SIGHUP/SIGUSR1：导入其他模块、预热及创建web应用期间收到的先记录下来，
+#安装处理函数之后再处理，不会因默认处理而结束进程：
+if __name__ == '__main__':
+    prefork.defer_signals()
+
 from aiohttp import web     #aiohttp.web 会自动创建 Request实例。
 from jinja2 import Environment, FileSystemLoader
 
@@ -17,10 +24,24 @@ from config import configs
 
 #导入orm.py文件
 import orm
+#导入apis.py文件
+from apis import dumps, iter_dumps, has_large_list
+#导入cache.py文件
+import cache
+#导入compression.py文件
+import compression
+#导入limits.py文件
+import limits
+#导入logs.py文件
+import logs
+#导入tracing.py文件
+import tracing
+#导入metrics.py文件
+import metrics
 #导入coroweb.py文件
-from coroweb import add_routes, add_static
+from coroweb import add_routes, add_static, make_etag, body_etag, validator_headers, not_modified, set_etag_salt, load_manifest, static_url
 #导入handlers.py文件
-from handlers import cookie2user, COOKIE_NAME
+from handlers import cookie2user, COOKIE_NAME, comment_hub, poll_comments
 
 
 
@@ -57,72 +78,315 @@ def init_jinja2(app, **kw):
     app['__templating__'] = env
 
 
+#正在处理的请求数；停止服务时等待这些请求处理完成：
+class InFlight(object):
+    '''
+    Count requests being handled.
+    '''
+
+    def __init__(self):
+        self.count = 0
+
+    #等待所有请求处理完成，最多等待timeout秒；返回剩余的请求数：
+    async def wait_idle(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.count > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return self.count
+
+_inflight = InFlight()
+
+#middlewares请求响应处理器-请求计数处理器：
+async def inflight_factory(app, handler):
+    async def inflight(request):
+        _inflight.count = _inflight.count + 1
+        try:
+            return await handler(request)
+        finally:
+            _inflight.count = _inflight.count - 1
+    return inflight
+
+#middlewares请求响应处理器-指标处理器：
+#按路由(注册的地址模式，如/blog/{id})、请求方法及状态码类别统计请求耗时；客户端断开(请求被取消)的不统计：
+async def metrics_factory(app, handler):
+    async def record_metrics(request):
+        start = time.perf_counter()
+        status = 500
+        try:
+            r = await handler(request)
+            status = r.status
+            return r
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        except asyncio.CancelledError:
+            status = None
+            raise
+        finally:
+            if status is not None:
+                resource = request.match_info.route.resource
+                route = resource.canonical if resource is not None else 'unmatched'
+                metrics.observe('http_request_duration_seconds', (('route', route), ('method', request.method), ('status', metrics.status_class(status))), time.perf_counter() - start)
+    return record_metrics
+
+#middlewares请求响应处理器-准入控制处理器：
+#限制同时处理的请求数(自适应)，过载时直接返回503，不再占用数据库连接等资源；
+#静态文件、健康检查及推送连接(长连接，会一直占用名额)不受限制：
+#(准入控制器由create_app()按配置设置；中间件工厂可能在每个请求时调用，这里不能修改其状态)
+async def admission_factory(app, handler):
+    conf = configs.admission
+
+    async def admission(request):
+        if app['__admission_exempt__'].search(request.path):
+            return await handler(request)
+        try:
+            await limits.admission.acquire()
+        except limits.Overloaded:
+            logging.warning('shed request: %s %s', request.method, request.path)
+            return web.HTTPServiceUnavailable(headers={'Retry-After': str(conf.retry_after)})
+        try:
+            return await handler(request)
+        finally:
+            limits.admission.release()
+    return admission
+
 #middlewares请求响应处理器-日志处理器：
 #记录URL日志：
-@asyncio.coroutine      #@asyncio.coroutine装饰，变成一个协程:
-def logger_factory(app, handler):
-    @asyncio.coroutine
-    def logger(request):
+async def logger_factory(app, handler):
+    async def logger(request):
         #不需要手动创建 Request实例 - aiohttp.web 会自动创建。
         #打印(请求方法及地址)日志：
-        logging.info('Request: %s %s' % (request.method, request.path))
-        # yield from asyncio.sleep(0.3)
-        return (yield from handler(request))
+        logging.info('Request: %s %s', request.method, request.path)
+        # await asyncio.sleep(0.3)
+        #按采样比例追踪请求(各阶段的span记录到该请求)：
+        trace, token = tracing.tracer.begin(request.method, request.path)
+        if trace is None:
+            return await handler(request)
+        r = None
+        try:
+            r = await handler(request)
+            #已开始发送的响应(推送、分段发送的JSON)不能再添加响应头：
+            if configs.tracing.server_timing and isinstance(r, web.StreamResponse) and not r.prepared:
+                r.headers['Server-Timing'] = trace.server_timing()
+            return r
+        finally:
+            tracing.tracer.end(trace, token, getattr(r, 'status', None))
     return logger
 
+#middlewares请求响应处理器-SQL统计处理器(仅调试模式)：
+#统计单个请求内每个SQL模板的执行次数，重复过多时告警，并通过响应头'X-Query-Count'返回SQL总数：
+async def query_stats_factory(app, handler):
+    async def query_stats(request):
+        stats = orm.QueryStats(configs.query_stats.threshold)
+        token = orm.begin_query_stats(stats)
+        try:
+            r = await handler(request)
+        finally:
+            orm.end_query_stats(token)
+        #响应头尚未发送时才能添加：
+        if isinstance(r, web.StreamResponse) and not r.prepared:
+            r.headers['X-Query-Count'] = str(stats.total)
+        return r
+    return query_stats
+
+#middlewares请求响应处理器-截止时间处理器：
+#为请求设置默认截止时间(路由可通过@get/@post的timeout参数覆盖)，数据库查询超过截止时间则返回503：
+async def deadline_factory(app, handler):
+    async def deadline(request):
+        token = orm.set_deadline(configs.deadline.default)
+        try:
+            return await handler(request)
+        except asyncio.TimeoutError as e:
+            #打印(请求超时)日志：
+            logging.warning('deadline exceeded: %s %s: %s', request.method, request.path, e)
+            return web.HTTPServiceUnavailable(headers={'Retry-After': str(configs.deadline.retry_after)})
+        finally:
+            orm.reset_deadline(token)
+    return deadline
+
+#middlewares请求响应处理器-压缩处理器：
+#按Accept-Encoding压缩文本类响应；较大的响应体在线程池中压缩，不阻塞事件循环；
+#需在page_cache_factory之前：整页缓存的页面每种编码只压缩一次，保存在缓存条目中：
+async def compression_factory(app, handler):
+    conf = configs.compression
+
+    async def compress(request):
+        r = await handler(request)
+        if not isinstance(r, web.Response) or r.prepared or r.status != 200 or not isinstance(r.body, bytes) \
+                or 'Content-Encoding' in r.headers or not compression.is_compressible(r.content_type):
+            return r
+        #内容随Accept-Encoding不同：
+        vary = r.headers.get('Vary')
+        r.headers['Vary'] = vary + ', Accept-Encoding' if vary else 'Accept-Encoding'
+        if len(r.body) < conf.min_size:
+            return r
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding'), conf.encodings)
+        if encoding is None:
+            return r
+        entry = request.get('__cache_entry__')
+        page = entry.value if entry is not None else None
+        body = page.variants.get(encoding) if page is not None else None
+        if body is None:
+            if len(r.body) >= conf.executor_size:
+                #zlib/brotli/zstd压缩时释放GIL，在线程池中执行：
+                body = await asyncio.get_event_loop().run_in_executor(None, compression.compress, r.body, encoding, conf.level)
+            else:
+                body = compression.compress(r.body, encoding, conf.level)
+            if page is not None:
+                page.variants[encoding] = body
+        r.body = body
+        r.headers['Content-Encoding'] = encoding
+        etag = r.headers.get('ETag')
+        if etag is not None:
+            r.headers['ETag'] = compression.encoded_etag(etag, encoding)
+        return r
+    return compress
+
+#整页缓存条目：保存响应的状态码、响应头及响应体，每次命中时生成新的web.Response：
+class CachedPage(object):
+    __slots__ = ('status', 'headers', 'body', 'etag', 'last_modified', 'variants')
+
+    def __init__(self, resp):
+        self.status = resp.status
+        self.headers = tuple((k, v) for k, v in resp.headers.items() if k.lower() != 'content-length')
+        self.body = resp.body
+        self.etag = resp.headers.get('ETag')
+        last_modified = resp.last_modified
+        self.last_modified = last_modified.timestamp() if last_modified is not None else None
+        self.variants = dict()      #编码 ==> 压缩后的响应体，由compression_factory填充。
+
+    def response(self, request, state):
+        #命中缓存时同样处理缓存验证条件：
+        if self.etag is not None:
+            resp = not_modified(request, self.etag, self.last_modified)
+            if resp is not None:
+                resp.headers['Vary'] = 'Cookie'
+                resp.headers['X-Cache'] = state
+                return resp
+        resp = web.Response(status=self.status, body=self.body, headers=self.headers)
+        resp.headers['X-Cache'] = state
+        return resp
+
+#整页缓存的页面总是完整生成，缓存验证条件在返回时处理：
+_CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+#middlewares请求响应处理器-整页缓存处理器：
+#匿名用户(无登录cookie)的GET页面请求按地址及查询字符串缓存ttl秒，过期后stale秒内先返回旧页面并在后台刷新；
+#需在auth_factory之前，命中时不再解析cookie；只缓存状态码为200且不设置cookie的响应：
+async def page_cache_factory(app, handler):
+    conf = configs.page_cache
+    cache.pages.maxsize = conf.maxsize
+    #以'/'结尾的配置项匹配前缀('/'本身只匹配首页)，其余精确匹配：
+    exact = frozenset(conf.paths)
+    prefixes = tuple(p for p in conf.paths if p.endswith('/') and p != '/')
+
+    def is_page(v):
+        return isinstance(v, CachedPage)
+
+    async def page_cache(request):
+        path = request.path
+        if request.method != 'GET' or COOKIE_NAME in request.cookies or not (path in exact or path.startswith(prefixes)):
+            return await handler(request)
+        loaded = False
+        async def load():
+            nonlocal loaded
+            loaded = True
+            #后台刷新时原请求已结束，因此使用请求副本及新的截止时间：
+            token = orm.set_deadline(configs.deadline.default)
+            headers = request.headers.copy()
+            for name in _CONDITIONAL_HEADERS:
+                headers.popall(name, None)
+            try:
+                r = await handler(request.clone(headers=headers))
+            finally:
+                orm.reset_deadline(token)
+            if isinstance(r, web.Response) and not r.prepared and r.status == 200 and 'Set-Cookie' not in r.headers:
+                return CachedPage(r)
+            return r
+        try:
+            e = await cache.pages.get_or_load(request.path_qs, load, conf.ttl, conf.stale, (path,), is_page)
+        except web.HTTPException:
+            #响应对象不能在请求之间共享，等待其他请求加载失败时自己重新处理：
+            if loaded:
+                raise
+            return await handler(request)
+        if not is_page(e.value):
+            if loaded:
+                return e.value
+            return await handler(request)
+        request['__cache_entry__'] = e
+        if loaded:
+            return e.value.response(request, 'MISS')
+        return e.value.response(request, 'HIT' if time.monotonic() < e.expires else 'STALE')
+    return page_cache
+
 #middlewares请求响应处理器-cookie解析处理器：
-@asyncio.coroutine      #@asyncio.coroutine装饰，变成一个协程:
-def auth_factory(app, handler):
-    @asyncio.coroutine
-    def auth(request):
+async def auth_factory(app, handler):
+    async def auth(request):
         #不需要手动创建 Request实例 - aiohttp.web 会自动创建。
         #打印(请求方法，请求路径)日志：
-        logging.info('check user: %s %s' % (request.method, request.path))
+        logging.info('check user: %s %s', request.method, request.path)
         request.__user__ = None
         cookie_str = request.cookies.get(COOKIE_NAME)
         if cookie_str:
             #根据COOKIE名解析对应cookie；
-            user = yield from cookie2user(cookie_str)
+            with tracing.span('auth'):
+                user = await cookie2user(cookie_str)
             #解析cookie信息不为空则赋值到request.__user__：
             if user:
                 #打印(设置当前用户信息)日志：
-                logging.info('set current user: %s' % user.email)
+                logging.info('set current user: %s', user.email)
                 request.__user__ = user
         #请求路径以‘/manage/’开头，且cookie用户信息不为空或cookie用户权限是否为管理员权限：
         if request.path.startswith('/manage/') and (request.__user__ is None or request.__user__.admin):
             return web.HTTPFound('/signin')
 
-        return (yield from handler(request))
+        return await handler(request)
     return auth
 
 
 #middlewares请求响应处理器-数据处理器：
-@asyncio.coroutine      #@asyncio.coroutine装饰，变成一个协程:
-def data_factory(app, handler):
-    @asyncio.coroutine
-    def parse_data(request):
+async def data_factory(app, handler):
+    async def parse_data(request):
         #判断请求方法是否为POST类型：
         if request.method == 'POST':
             #判断POST请求的实体MIME类型：
             if request.content_type.startswith('application/json'):
                 #request.json() 是个协程。
-                request.__data__ = yield from request.json()    #以JSON编码读取请求内容：
-                logging.info('request json: %s' % str(request.__data__))
+                request.__data__ = await request.json()    #以JSON编码读取请求内容：
+                logging.info('request json: %s', request.__data__)
             elif request.content_type.startswith('application/x-www-form-urlencoded'):
                 #request.post() 是个协程。
-                request.__data__ = yield from request.post()    #读取请求内容的POST参数：
-                logging.info('request form: %s' % str(request.__data__))
-        return (yield from handler(request))
+                request.__data__ = await request.post()    #读取请求内容的POST参数：
+                logging.info('request form: %s', request.__data__)
+        return await handler(request)
     return parse_data
 
+#分段编码JSON并以chunked方式发送；编码在各段之间让出事件循环：
+async def stream_json(request, r, etag=None, last_modified=None):
+    resp = web.StreamResponse()
+    resp.content_type = 'application/json'
+    resp.charset = 'utf-8'
+    if etag is not None:
+        resp.headers.update(validator_headers(etag, last_modified))
+    resp.enable_chunked_encoding()
+    #已开始发送的响应不经过compression_factory，由aiohttp按Accept-Encoding逐段压缩：
+    if configs.compression.enabled:
+        resp.enable_compression()
+        resp.headers['Vary'] = 'Accept-Encoding'
+    await resp.prepare(request)
+    for chunk in iter_dumps(r, configs.json.stream_batch):
+        await resp.write(chunk)
+        await asyncio.sleep(0)
+    await resp.write_eof()
+    return resp
+
 #middlewares请求响应处理器-响应处理器：
 #把返回值转换为web.Response 对象再返回，以保证满足aiohttp的要求：
-@asyncio.coroutine      #@asyncio.coroutine装饰，变成一个协程:
-def response_factory(app, handler):
-    @asyncio.coroutine
-    def response(request):
+async def response_factory(app, handler):
+    async def response(request):
         logging.info('Response handler... ')
-        r = yield from handler(request)
+        r = await handler(request)
 
         #判断是否为“HTTP响应处理”类型，True则返回：
         if isinstance(r, web.StreamResponse):
@@ -150,21 +414,51 @@ def response_factory(app, handler):
         if isinstance(r, dict):
             #获取字典中的env环境对象：
             template = r.get('__template__')
+            #处理函数可通过'__version__'(如数据的更新时间)及'__last_modified__'(时间戳)给出版本；
+            #给出版本时无需生成响应体即可判断是否返回304，否则根据响应体生成ETag：
+            version = r.get('__version__')
+            last_modified = r.get('__last_modified__')
+            etag = None
+            if version is not None:
+                etag = make_etag(request, version)
+                resp = not_modified(request, etag, last_modified)
+                if resp is not None:
+                    if template is not None:
+                        resp.headers['Vary'] = 'Cookie'
+                    return resp
             #判断env环境对象是否为None：
             if template is None:
-                #json.dumps()：以JSON编码格式转换python对象，返回一个str。“ensure_ascii=False”：非ASCII字符不转换，原样输出。
-                resp = web.Response(body=json.dumps(r, ensure_ascii=False, default=lambda o: o.__dict__).encode('utf-8'))
+                if version is not None or last_modified is not None:
+                    r = {k: v for k, v in r.items() if k != '__version__' and k != '__last_modified__'}
+                #包含较大列表的结果分段编码，以chunked方式边编码边发送，不在内存中生成完整的响应体：
+                if has_large_list(r, configs.json.stream_threshold):
+                    return await stream_json(request, r, etag, last_modified)
+                #apis.dumps()：以JSON编码格式转换python对象(安装了orjson时使用orjson)，返回utf-8编码的bytes。
+                with tracing.span('encode'):
+                    resp = web.Response(body=dumps(r))
                 #设置实体MIME类型：
                 resp.content_type = 'application/json;charset=utf-8'
-                return resp
             else:
                 #取出cookie用户信息绑定到request对象：
                 r['__user__'] = request.__user__
                 #jinja2.Environment.get_template()：加载指定模板。
                 #jinja2.Template.render()：返回模板unicode字符串。
-                resp = web.Response(body=app['__templating__'].get_template(template).render(**r).encode('utf-8'))
+                start = time.perf_counter()
+                with tracing.span('render', template=template):
+                    resp = web.Response(body=app['__templating__'].get_template(template).render(**r).encode('utf-8'))
+                metrics.observe('template_render_duration_seconds', (('template', template),), time.perf_counter() - start)
                 resp.content_type = 'text/html;charset=utf-8'
-                return resp
+                #页面内容随登录用户不同：
+                resp.headers['Vary'] = 'Cookie'
+            if etag is None:
+                etag = body_etag(resp.body)
+                not_modified_resp = not_modified(request, etag, last_modified)
+                if not_modified_resp is not None:
+                    if template is not None:
+                        not_modified_resp.headers['Vary'] = 'Cookie'
+                    return not_modified_resp
+            resp.headers.update(validator_headers(etag, last_modified))
+            return resp
         #判断是否为“int”类型且 100<= r <600，直接返回r：
         if isinstance(r, int) and r >= 100 and r < 600:
             return web.Response(r)
@@ -200,36 +494,180 @@ def datetime_filter(t):
     return u'%s年%s月%s日' % (dt.year, dt.month, dt.day)
 
 
-#@asyncio.coroutine把一个generator标记为coroutine类型，然后把这个coroutine扔到EventLoop中执行：
-@asyncio.coroutine
-def init(loop):
-    #orm.create_pool()创建数据库连接：
-    yield from orm.create_pool(loop=loop, host='127.0.0.1', port=3306, user='root', password='', db='awesome')
+#创建web应用：注册中间件、模板、URL处理函数及静态文件；多进程模式下在fork之前调用，由各工作进程共享：
+def create_app():
     #创建 middlewares 请求响应处理器(字典类型)对象，可以通过‘请求处理程序’返回对应数据：
-    app = web.Application(loop=loop, middlewares=[
-        logger_factory, auth_factory, response_factory
-    ])
-    #初始化jinja2模板，添加filter(过滤器)：
-    init_jinja2(app, filters=dict(datetime=datetime_filter))
+    middlewares = [inflight_factory, logger_factory, deadline_factory, auth_factory, response_factory]
+    #整页缓存(需在auth_factory之前)：
+    if configs.page_cache.enabled:
+        middlewares.insert(3, page_cache_factory)
+    #响应压缩(需在page_cache_factory之前)：
+    if configs.compression.enabled:
+        middlewares.insert(3, compression_factory)
+    #准入控制(在其他处理之前尽早拒绝)：
+    if configs.admission.enabled:
+        middlewares.insert(1, admission_factory)
+    #请求耗时指标(在准入控制之前，被拒绝的请求也统计)：
+    if configs.metrics.enabled:
+        middlewares.insert(1, metrics_factory)
+    #调试模式下开启SQL统计(需在auth_factory之前，以便统计cookie解析的查询)：
+    if configs.debug:
+        middlewares.insert(middlewares.index(logger_factory) + 1, query_stats_factory)
+    app = web.Application(middlewares=middlewares)
+    if configs.admission.enabled:
+        conf = configs.admission
+        limits.admission.configure(conf.initial_limit, conf.min_limit, conf.max_limit, conf.target, conf.interval, conf.max_wait, conf.backoff)
+        app['__admission_exempt__'] = re.compile('|'.join('(?:%s)' % p for p in conf.exempt))
+    #写操作限速(需在add_routes之前)；多进程模式下create_app()在fork之前调用，共享内存由各工作进程继承：
+    limits.setup_rate_limits(configs.rate_limits.routes, configs.rate_limits.maxsize, configs.rate_limits.shared and configs.server.workers > 0, configs.rate_limits.trusted_proxies)
+    #按路由类别隔离并发及数据库连接(需在add_routes之前)：
+    for name, conf in configs.route_classes.items():
+        limits.add_bulkhead(name, conf.concurrency, conf.max_wait, conf.retry_after)
+        orm.set_connection_limit(name, conf.connections)
+    tracing.tracer.configure(configs.tracing.sample, configs.tracing.buffer_size)
+    cache.handlers.maxsize = configs.handler_cache.maxsize
+    #初始化jinja2模板，添加filter(过滤器)；非调试模式下不再每次渲染都检查模板文件是否修改，改为收到SIGUSR1时重新加载：
+    init_jinja2(app, filters=dict(datetime=datetime_filter), auto_reload=configs.debug)
+    #模板函数static_url()：返回静态文件(构建过则为带哈希的文件)的地址：
+    app['__templating__'].globals['static_url'] = static_url
+    #多进程模式下新评论可能由其他工作进程创建：
+    if configs.server.workers > 0:
+        app.cleanup_ctx.append(comment_poller)
+    #多进程模式下各工作进程定期保存指标快照，由/metrics合并；create_app()在fork之前调用，快照目录只清空一次：
+    if configs.server.workers > 0 and configs.metrics.enabled:
+        metrics.setup(configs.metrics.dir or os.path.join(tempfile.gettempdir(), 'awesome-metrics-%s' % os.getpid()))
+        app.cleanup_ctx.append(metrics_saver)
     #'handelers'模块自动注册,也就是取代aiohttp.web.UrlDispatcher.add_route()单个增加响应规则：
     add_routes(app, 'handlers')
     #aiohttp.web.UrlDispatcher.add_route():增加响应规则；即设置请求条件(请求方式，地址等...)和对应的处理程序：
     #app.router.add_route('GET', '/', index)
     #给文件添加静态地址：
     add_static(app)
+    #预先编译所有模板；多进程模式下在fork之前完成，工作进程直接使用：
+    load_templates(app)
+    return app
+
+#编译并缓存所有模板；reload为True时先清空已缓存的模板，用于模板修改后原地重新加载：
+def load_templates(app, reload=False):
+    env = app['__templating__']
+    if reload:
+        env.cache.clear()
+        #模板变化后缓存的页面失效：
+        cache.pages.clear()
+        logging.info('reload templates...')
+    mtime = 0
+    for name in env.list_templates(extensions=['html']):
+        mtime = max(mtime, os.path.getmtime(env.get_template(name).filename))
+    #重新加载带哈希的静态文件列表(build_assets.py生成)：
+    assets = load_manifest()
+    #版本ETag混入模板的最后修改时间及静态文件版本，变化后浏览器缓存的页面失效(各工作进程一致)：
+    set_etag_salt('%r:%s' % (mtime, assets))
 
+#init()为原生协程，扔到EventLoop中执行：
+#创建(本进程的)数据库连接池并预热，然后在sock(未指定则按配置的地址)上开始接受请求，返回(runner, srv)：
+#sock为监听socket，或创建监听socket的函数(在预热完成之后调用，此前内核不会把连接分配给本进程)：
+async def init(loop, app=None, sock=None):
+    #orm.create_pool()创建数据库连接：
+    await orm.create_pool(loop=loop, **configs.db)
+    #预热连接池；在开始接受请求之前完成：
+    if configs.db.warmup > 0:
+        await orm.warm_up_pool(configs.db.warmup)
+    if app is None:
+        app = create_app()
+    #web.AppRunner创建HTTP协议处理器(runner.server)来处理请求：
+    runner = web.AppRunner(app)
+    await runner.setup()
+    if callable(sock):
+        sock = sock()
     #loop.create_server()利用asyncio创建TCP服务：
-    #make_handler()创建HTTP协议处理器来处理请求：
-    srv = yield from loop.create_server(app.make_handler(), '127.0.0.1', 9000)
+    if sock is None:
+        srv = await loop.create_server(runner.server, configs.server.host, configs.server.port)
+    else:
+        srv = await loop.create_server(runner.server, sock=sock)
     #打印日志信息：
-    logging.info('server started at http://127.0.0.1:9000...')
-    return srv
+    logging.info('server %s started at http://%s:%s...' % (os.getpid(), configs.server.host, configs.server.port))
+    return runner, srv
+
+#多进程模式下在各工作进程中轮询其他进程创建的新评论并推送(app.cleanup_ctx)：
+async def comment_poller(app):
+    task = asyncio.ensure_future(poll_comments(configs.sse.poll_interval))
+    yield
+    task.cancel()
+
+#多进程模式下在各工作进程中定期保存指标快照(app.cleanup_ctx)；停止时再保存一次：
+async def metrics_saver(app):
+    async def save():
+        while True:
+            await asyncio.sleep(configs.metrics.save_interval)
+            metrics.save_snapshot()
+    task = asyncio.ensure_future(save())
+    yield
+    task.cancel()
+    metrics.save_snapshot()
+
+#停止服务：停止接受请求，等待正在处理的请求完成(最多drain_timeout秒)，然后关闭HTTP处理器及数据库连接池：
+async def shutdown(runner, srv):
+    srv.close()
+    await srv.wait_closed()
+    #推送连接不会自行结束，先关闭所有订阅，不占用等待时间：
+    comment_hub.close()
+    left = await _inflight.wait_idle(configs.server.drain_timeout)
+    if left:
+        logging.warning('server %s stopped with %s requests in flight.' % (os.getpid(), left))
+    await runner.cleanup()
+    await orm.close_pool()
 
+#运行一个服务进程，直到收到SIGTERM/SIGINT；heartbeat为多进程模式下向主进程发送心跳的对象：
+def run_worker(app=None, sock=None, heartbeat=None):
+    #设置日志输出(异步模式的后台线程在工作进程中启动)：
+    logs.setup(configs.logging)
+    #创建EventLoop:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    #单进程模式下自行创建监听socket(预热完成后创建)；平滑重启时使用重新执行前的进程保留的socket，重启期间不拒绝连接：
+    if heartbeat is None and sock is None:
+        sock = prefork.inherit_socket() or functools.partial(prefork.create_socket, configs.server.host, configs.server.port, reuse_port=False)
+    #执行coroutine(协程)：
+    runner, srv = loop.run_until_complete(init(loop, app, sock))
+    if heartbeat is not None:
+        heartbeat.start(loop)
+    stopping = loop.create_future()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda sig=sig: stopping.done() or stopping.set_result(sig))
+    #单进程模式下没有主进程，收到SIGHUP后检查源代码，处理完当前请求再重新执行自身；
+    #监听socket保留给新进程，重启期间到达的连接在监听队列中等待，由新进程处理：
+    def reload():
+        errors = prefork.check_sources(os.path.dirname(os.path.abspath(__file__)))
+        for fn, err in errors:
+            logging.error('reload aborted, can not compile %s: %s' % (fn, err))
+        if not errors and not stopping.done():
+            stopping.set_result(signal.SIGHUP)
+    if heartbeat is None:
+        loop.add_signal_handler(signal.SIGHUP, reload)
+    #收到SIGUSR1时原地重新加载模板，无需重启：
+    loop.add_signal_handler(signal.SIGUSR1, load_templates, runner.app, True)
+    if heartbeat is None:
+        prefork.replay_signals()
+    #持续运行直到收到停止信号：
+    sig = loop.run_until_complete(stopping)
+    logging.info('server %s stopping...' % os.getpid())
+    #srv.close()会关闭监听socket，先保留一份：
+    env = prefork.keep_socket(srv.sockets[0]) if sig == signal.SIGHUP else None
+    if heartbeat is not None:
+        heartbeat.stop()
+    loop.run_until_complete(shutdown(runner, srv))
+    #loop.close()会把信号恢复为默认处理，此后到重新执行之前收到的SIGHUP/SIGUSR1只记录，不结束进程：
+    loop.close()
+    prefork.defer_signals()
+    logs.stop()
+    if sig == signal.SIGHUP:
+        prefork.reexec(env)
 
 
-# 获取EventLoop:
-loop = asyncio.get_event_loop()
-# 执行coroutine(协程)：
-loop.run_until_complete(init(loop))
-#持续运行直到调用停止命令：
-loop.run_forever()
+if __name__ == '__main__':
+    if configs.server.workers > 0:
+        #多进程模式：主进程在fork之前创建web应用，工作进程各自创建数据库连接池和监听socket：
+        app = create_app()
+        prefork.Supervisor(lambda sock, heartbeat: run_worker(app, sock, heartbeat), configs.server).run()
+    else:
+        run_worker()
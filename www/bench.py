@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+性能测试：测量框架各层的单次开销。
+用法：python3 bench.py [dispatch] [coroutine] [json] [logging] [-n 次数]
+'''
+
+import sys, json, time, types, inspect, functools, asyncio, logging
+
+#最小化的请求对象，只提供RequestHandler用到的属性：
+class BenchRequest(object):
+    '''
+    Minimal stand-in of aiohttp.web.Request for RequestHandler.
+    '''
+
+    def __init__(self, method='GET', query_string='', match_info=None, body=None):
+        self.method = method
+        self.query_string = query_string
+        self.match_info = match_info or dict()
+        self.content_type = 'application/json' if body is not None else ''
+        self._body = body
+        self.__user__ = None
+
+    async def json(self):
+        return self._body
+
+#收集add_route()注册的RequestHandler：
+class BenchRouter(object):
+
+    def __init__(self):
+        self.handlers = dict()
+
+    def add_route(self, method, path, handler):
+        self.handlers[(method, path)] = handler
+
+class BenchApp(dict):
+
+    def __init__(self):
+        super(BenchApp, self).__init__()
+        self.router = BenchRouter()
+
+#测试用例：(名称, 处理函数, 请求)：
+def dispatch_cases():
+    #导入coroweb.py文件(依赖aiohttp，仅在需要时导入)：
+    from coroweb import get, post
+
+    @get('/bench')
+    def h_plain():
+        return 'ok'
+
+    @get('/bench/{id}')
+    async def h_match(id):
+        return id
+
+    @get('/bench/query')
+    async def h_query(*, page='1'):
+        return page
+
+    @post('/bench/{id}/body')
+    async def h_body(id, request, *, name, summary, content):
+        return name
+
+    #旧式yield from写法的处理函数，经兼容层调用：
+    @get('/bench/legacy/{id}')
+    def h_legacy(id):
+        yield from ()
+        return id
+
+    return [
+        ('plain', h_plain, BenchRequest()),
+        ('match_info', h_match, BenchRequest(match_info=dict(id='001'))),
+        ('query', h_query, BenchRequest(query_string='page=2&t=1')),
+        ('json_body', h_body, BenchRequest('POST', match_info=dict(id='001'), body=dict(name='n', summary='s', content='c', extra='x'))),
+        ('legacy', h_legacy, BenchRequest(match_info=dict(id='001')))
+    ]
+
+#测量RequestHandler从收到请求到调用处理函数(含参数绑定)的单次开销：
+def bench_dispatch(n):
+    from coroweb import add_route
+    app = BenchApp()
+    loop = asyncio.new_event_loop()
+    for name, fn, request in dispatch_cases():
+        add_route(app, fn)
+        handler = app.router.handlers[(fn.__method__, fn.__route__)]
+
+        async def run():
+            for i in range(n):
+                await handler(request)
+
+        start = time.perf_counter()
+        loop.run_until_complete(run())
+        elapsed = time.perf_counter() - start
+        print('dispatch %-12s %8.2f us/request' % (name, elapsed * 1e6 / n))
+    loop.close()
+
+#旧式协程装饰器：与Python 3.10及之前非调试模式下的@asyncio.coroutine行为相同：
+#生成器函数直接标记为协程，普通函数则包装一层，调用后再等待返回的生成器或Future：
+def legacy_coroutine(func):
+    if inspect.isgeneratorfunction(func):
+        return types.coroutine(func)
+    @functools.wraps(func)
+    def coro(*args, **kw):
+        res = func(*args, **kw)
+        if inspect.isgenerator(res) or isinstance(res, asyncio.Future):
+            res = yield from res
+        return res
+    return types.coroutine(coro)
+
+#旧式@get装饰器包装的一层函数：
+def legacy_route_wrapper(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kw):
+        return func(*args, **kw)
+    return wrapper
+
+#构造旧式(yield from)协程调用链：layers层中间件/查询层包裹最内层的函数；
+#route为True时模拟旧版add_route()：@get包装的函数不是生成器函数，会再被asyncio.coroutine包装一层：
+def legacy_chain(layers, route):
+    def leaf():
+        return 1
+        yield
+    fn = legacy_coroutine(leaf)
+    if route:
+        fn = legacy_coroutine(legacy_route_wrapper(fn))
+    for i in range(layers):
+        def make(inner):
+            def layer():
+                return (yield from inner())
+            return legacy_coroutine(layer)
+        fn = make(fn)
+    return fn
+
+#构造原生(async def / await)协程调用链：处理函数直接注册，没有额外的包装层：
+def native_chain(layers, route):
+    async def leaf():
+        return 1
+    fn = leaf
+    for i in range(layers):
+        def make(inner):
+            async def layer():
+                return await inner()
+            return layer
+        fn = make(fn)
+    return fn
+
+#驱动协程直到完成(不经过事件循环，只测量协程调用链本身的开销)：
+def drive(coro):
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError('coroutine suspended')
+
+#对比移植前(yield from)与移植后(await)的协程调用链开销：(名称, 包裹层数, 是否经过路由注册)：
+#   request：logger/deadline/auth/response中间件 ==> RequestHandler ==> 处理函数；
+#   query：Model.findAll ==> select ==> _run_before_deadline ==> _select。
+COROUTINE_CASES = [
+    ('request', 5, True),
+    ('query', 3, False)
+]
+
+def bench_coroutine(n):
+    for name, layers, route in COROUTINE_CASES:
+        results = []
+        for label, chain in (('before', legacy_chain(layers, route)), ('after', native_chain(layers, route))):
+            start = time.perf_counter()
+            for i in range(n):
+                drive(chain())
+            elapsed = time.perf_counter() - start
+            results.append(elapsed * 1e6 / n)
+            print('coroutine %-8s %-7s %8.3f us/call' % (name, label, results[-1]))
+        print('coroutine %-8s saved   %8.3f us/call (%.1f%%)' % (name, results[0] - results[1], (results[0] - results[1]) * 100 / results[0]))
+
+#对比原来的json.dumps与apis.dumps(安装了orjson时使用orjson)编码一页评论的开销，size为每页评论数：
+JSON_SIZES = [10, 100, 1000]
+
+def bench_json(n):
+    import apis
+    from models import Comment
+    for size in JSON_SIZES:
+        comments = [Comment(id='%050d' % i, blog_id='0' * 50, user_id='0' * 50, user_name=u'用户%s' % i, user_image='about:blank', content=u'评论内容' * 20, created_at=time.time()) for i in range(size)]
+        r = dict(page=apis.Page(size * 10, 2, size), comments=comments)
+        count = max(n // size, 10)
+        results = []
+        for label, encode in (('json', lambda: json.dumps(r, ensure_ascii=False, default=lambda o: o.__dict__).encode('utf-8')), ('apis', lambda: apis.dumps(r))):
+            start = time.perf_counter()
+            for i in range(count):
+                encode()
+            results.append((time.perf_counter() - start) * 1e6 / count)
+            print('json %5d %-5s %10.2f us/page' % (size, label, results[-1]))
+        print('json %5d saved %10.2f us/page (%.1f%%, encoder: %s)' % (size, results[0] - results[1], (results[0] - results[1]) * 100 / results[0], 'orjson' if apis.orjson else 'json'))
+
+#对比一个请求的日志开销：(名称, 日志写法, logs.setup的配置)：
+#   before：原来的写法，立即用%格式化并同步写入(查找调用位置)；
+#   async：参数形式，由后台线程格式化并写入；
+#   sampled：在async的基础上INFO只输出10%。
+#loop为事件循环线程的CPU时间(time.thread_time())；wall为包括等待后台线程写完的总时间，
+#后台线程同样需要GIL，事件循环一直忙碌时(如本测试)会与其争用，因此wall不一定减少：
+LOGGING_CASES = [
+    ('before', 'eager', dict(level='INFO', format='text', sample=dict(), **{'async': False})),
+    ('async', 'lazy', dict(level='INFO', format='text', queue_size=1000000, sample=dict(), **{'async': True})),
+    ('sampled', 'lazy', dict(level='INFO', format='text', queue_size=1000000, sample=dict(INFO=0.1), **{'async': True}))
+]
+
+#一个请求大致产生的日志(logger/auth/response中间件、RequestHandler、两次查询)：
+def log_request_eager(request, user, kw, rs):
+    logging.info('Request: %s %s' % (request.method, request.path))
+    logging.info('check user: %s %s' % (request.method, request.path))
+    logging.info('set current user: %s' % user)
+    logging.info('Response handler... ')
+    logging.info('call with args: %s' % kw)
+    for i in range(2):
+        logging.info('SQL: %s' % 'select `id`, `name` from `blogs` where `id`=?')
+        logging.info('rows returned: %s' % len(rs))
+
+def log_request_lazy(request, user, kw, rs):
+    logging.info('Request: %s %s', request.method, request.path)
+    logging.info('check user: %s %s', request.method, request.path)
+    logging.info('set current user: %s', user)
+    logging.info('Response handler... ')
+    logging.info('call with args: %s', kw)
+    for i in range(2):
+        logging.info('SQL: %s', 'select `id`, `name` from `blogs` where `id`=?')
+        logging.info('rows returned: %s', len(rs))
+
+def bench_logging(n):
+    import logs, tempfile
+    from config import toDict
+    request = BenchRequest('GET', 'page=2')
+    request.path = '/api/blogs/0012345/comments'
+    kw = dict(id='0012345', page='2', request=request)
+    rs = list(range(10))
+    count = max(n // 10, 10)
+    srcfile = logging._srcfile
+    #写入临时文件(每条日志一次write)：
+    with tempfile.TemporaryFile('w') as f:
+        results = []
+        for label, style, conf in LOGGING_CASES:
+            logs.setup(toDict(conf), f)
+            if style == 'eager':
+                #原来的配置会查找每条日志的调用位置：
+                logging._srcfile, logging.logThreads, logging.logMultiprocessing = srcfile, True, True
+            log_request = log_request_eager if style == 'eager' else log_request_lazy
+            start, cpu = time.perf_counter(), time.thread_time()
+            for i in range(count):
+                log_request(request, 'user@example.com', kw, rs)
+            cpu = time.thread_time() - cpu
+            #等待后台线程写完：
+            logs.stop()
+            results.append((cpu * 1e6 / count, (time.perf_counter() - start) * 1e6 / count))
+            print('logging %-8s loop %8.2f us/request, wall %8.2f us/request' % (label, results[-1][0], results[-1][1]))
+        for (label, style, conf), (cpu, wall) in zip(LOGGING_CASES[1:], results[1:]):
+            print('logging %-8s saved loop %8.2f us/request (%.1f%%)' % (label, results[0][0] - cpu, (results[0][0] - cpu) * 100 / results[0][0]))
+    logging.getLogger().setLevel(logging.WARNING)
+
+BENCHMARKS = dict(dispatch=bench_dispatch, coroutine=bench_coroutine, json=bench_json, logging=bench_logging)
+
+if __name__ == '__main__':
+    #关闭注册路由等日志，避免影响测量：
+    logging.basicConfig(level=logging.WARNING)
+    argv = sys.argv[1:]
+    n = 100000
+    if '-n' in argv:
+        i = argv.index('-n')
+        n = int(argv[i + 1])
+        del argv[i:i + 2]
+    for name in (argv or sorted(BENCHMARKS.keys())):
+        BENCHMARKS[name](n)
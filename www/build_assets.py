@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+静态文件构建：把static/下的文件按内容哈希复制到static/dist/(文件名带哈希)，
+并为可压缩的文件生成预压缩的.gz/.br文件，最后写入manifest.json(原文件名 ==> 带哈希的文件名)。
+页面通过模板函数static_url()引用带哈希的文件，由服务器以长期缓存(immutable)的响应头返回。
+用法：python3 build_assets.py [--clean]
+构建完成后重启服务器或向其发送SIGUSR1以重新加载manifest.json；旧的带哈希文件保留，--clean时先清空dist/。
+'''
+
+import logging; logging.basicConfig(level=logging.INFO)
+
+import os, re, sys, json, shutil, hashlib, posixpath
+
+#导入compression.py文件
+import compression
+
+STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST = os.path.join(STATIC, 'dist')
+MANIFEST = os.path.join(DIST, 'manifest.json')
+
+#值得预压缩的文件扩展名(图片及woff已经是压缩格式)：
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.otf', '.eot', '.json', '.txt')
+
+#CSS中的url(...)引用：
+_RE_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")?#]+)([?#][^\'")]*)?\1\s*\)')
+
+#遍历static/下的文件(不包括dist/)，返回相对路径列表(使用'/'分隔)：
+def list_assets():
+    names = []
+    for root, dirs, files in os.walk(STATIC):
+        if os.path.abspath(root) == STATIC and 'dist' in dirs:
+            dirs.remove('dist')
+        for f in files:
+            if not f.startswith('.'):
+                names.append(os.path.relpath(os.path.join(root, f), STATIC).replace(os.sep, '/'))
+    #CSS最后处理，其中引用的文件(字体、图片)已有带哈希的文件名：
+    return sorted(names, key=lambda n: (n.endswith('.css'), n))
+
+#把CSS中引用的相对路径替换为带哈希的文件名：
+def rewrite_css(name, text, manifest):
+    base = posixpath.dirname(name)
+    def replace(m):
+        quote, url, suffix = m.group(1), m.group(2), m.group(3) or ''
+        if url.startswith(('/', 'data:', 'http:', 'https:')):
+            return m.group(0)
+        target = posixpath.normpath(posixpath.join(base, url))
+        hashed = manifest.get(target)
+        if hashed is None:
+            return m.group(0)
+        return 'url(%s%s%s%s)' % (quote, posixpath.relpath(hashed, base), suffix, quote)
+    return _RE_CSS_URL.sub(replace, text)
+
+#文件名加上内容哈希，如css/awesome.css ==> css/awesome.0123abcd.css：
+def hashed_name(name, data):
+    root, ext = posixpath.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha1(data).hexdigest()[:12], ext)
+
+#写入文件及预压缩文件(压缩后更小才写入)：
+def write_asset(name, data):
+    path = os.path.join(DIST, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if not name.endswith(COMPRESSIBLE):
+        return
+    for encoding, ext in (('gzip', '.gz'), ('br', '.br')):
+        if encoding not in compression.CODECS:
+            continue
+        body = compression.compress(data, encoding, 9)
+        if len(body) < len(data):
+            with open(path + ext, 'wb') as f:
+                f.write(body)
+
+def build(clean=False):
+    if clean and os.path.isdir(DIST):
+        shutil.rmtree(DIST)
+    manifest = dict()
+    for name in list_assets():
+        with open(os.path.join(STATIC, *name.split('/')), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = rewrite_css(name, data.decode('utf-8'), manifest).encode('utf-8')
+        manifest[name] = hashed_name(name, data)
+        write_asset(manifest[name], data)
+        logging.info('%s => %s' % (name, manifest[name]))
+    if 'br' not in compression.CODECS:
+        logging.warning('brotli is not installed, .br files are not generated.')
+    #先写入临时文件再改名，服务器不会读到写了一半的manifest.json：
+    with open(MANIFEST + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(MANIFEST + '.tmp', MANIFEST)
+    logging.info('write %s assets to %s' % (len(manifest), MANIFEST))
+    return manifest
+
+if __name__ == '__main__':
+    build(clean='--clean' in sys.argv[1:])
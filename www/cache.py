@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+进程内缓存：
+    - 过期时间(ttl)及容量上限，超出容量时淘汰最久未使用的条目(LRU)；
+    - 过期后stale秒内仍返回旧值，同时在后台刷新(stale-while-revalidate)；
+    - 同一key并发未命中时只加载一次，其余请求等待同一结果；
+    - 条目可带标签(tags)，写操作后按标签清除。
+多进程模式下每个工作进程各有一份缓存，清除只作用于当前进程，其他进程的条目最多在ttl后刷新。
+'''
+
+import time, asyncio, logging
+
+from collections import OrderedDict
+
+#缓存条目：
+class CacheEntry(object):
+    __slots__ = ('key', 'value', 'tags', 'created_at', 'expires', 'stale_until')
+
+    def __init__(self, key, value, ttl, stale, tags):
+        now = time.monotonic()
+        self.key = key
+        self.value = value
+        self.tags = tags
+        self.created_at = now
+        self.expires = now + ttl                #在此之前为新鲜条目。
+        self.stale_until = self.expires + stale #在此之前可作为旧值返回。
+
+class Cache(object):
+    '''
+    In-process LRU cache with ttl, stale-while-revalidate, single-flight loading and tag purges.
+    '''
+
+    def __init__(self, name, maxsize=1000):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries = OrderedDict()       #key ==> CacheEntry，按最近使用排序。
+        self._tags = dict()                 #tag ==> set(key)
+        self._loading = dict()              #key ==> 正在加载的Future。
+        self._refreshing = set()            #正在后台刷新的key。
+        self._generation = 0                #每次清除加1，加载期间发生清除时结果不保存。
+        self.hits = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.purges = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    #返回未过期(含可作为旧值返回)的条目，没有则返回None：
+    def get_entry(self, key):
+        e = self._entries.get(key)
+        if e is None:
+            return None
+        if time.monotonic() >= e.stale_until:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return e
+
+    #保存条目，返回CacheEntry：
+    def set(self, key, value, ttl, stale=0, tags=()):
+        self._remove(key)
+        e = CacheEntry(key, value, ttl, stale, tuple(tags))
+        self._entries[key] = e
+        for tag in e.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+        return e
+
+    def delete(self, key):
+        self._remove(key)
+
+    #按标签清除条目，返回清除的条目数：
+    def purge_tags(self, *tags):
+        n = 0
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                n = n + 1
+        self._generation = self._generation + 1
+        self.purges = self.purges + n
+        return n
+
+    def clear(self):
+        self._generation = self._generation + 1
+        self._entries.clear()
+        self._tags.clear()
+
+    #返回key对应的条目，未命中时调用协程函数loader()加载；
+    #cacheable(value)返回False的结果不保存(仍返回给调用方)；同一key并发未命中时只调用一次loader：
+    async def get_or_load(self, key, loader, ttl, stale=0, tags=(), cacheable=None):
+        e = self.get_entry(key)
+        if e is not None:
+            if time.monotonic() < e.expires:
+                self.hits = self.hits + 1
+            else:
+                #旧值先返回，后台刷新(同一key只刷新一次)：
+                self.stale_hits = self.stale_hits + 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    asyncio.ensure_future(self._refresh(key, loader, ttl, stale, tags, cacheable))
+            return e
+        fut = self._loading.get(key)
+        if fut is not None:
+            #已有请求在加载同一key，等待其结果：
+            self.coalesced = self.coalesced + 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                #加载的请求被取消(如客户端断开)而本请求没有被取消时，重新加载：
+                task = asyncio.current_task()
+                if not fut.cancelled() or (hasattr(task, 'cancelling') and task.cancelling()):
+                    raise
+            return await self.get_or_load(key, loader, ttl, stale, tags, cacheable)
+        self.misses = self.misses + 1
+        fut = asyncio.get_event_loop().create_future()
+        #没有其他请求等待时，异常由本请求抛出，这里标记为已读取，避免“异常未读取”的告警：
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._loading[key] = fut
+        try:
+            e = await self._load(key, loader, ttl, stale, tags, cacheable)
+        except asyncio.CancelledError:
+            #本请求被取消不是加载失败，等待的请求各自重新加载：
+            fut.cancel()
+            raise
+        except BaseException as ex:
+            fut.set_exception(ex)
+            raise
+        else:
+            fut.set_result(e)
+            return e
+        finally:
+            self._loading.pop(key, None)
+
+    async def _load(self, key, loader, ttl, stale, tags, cacheable):
+        generation = self._generation
+        value = await loader()
+        if generation != self._generation or (cacheable is not None and not cacheable(value)):
+            return CacheEntry(key, value, 0, 0, ())
+        return self.set(key, value, ttl, stale, tags)
+
+    async def _refresh(self, key, loader, ttl, stale, tags, cacheable):
+        try:
+            await self._load(key, loader, ttl, stale, tags, cacheable)
+        except Exception as e:
+            logging.warning('failed to refresh cache %s: %s: %s' % (self.name, key, e))
+        finally:
+            self._refreshing.discard(key)
+
+    def _remove(self, key):
+        e = self._entries.pop(key, None)
+        if e is not None:
+            for tag in e.tags:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+    #返回最近使用的limit个条目的key、标签及剩余有效时间(秒)：
+    def entries(self, limit=100):
+        now = time.monotonic()
+        keys = list(self._entries)[-limit:]
+        return [dict(key=k, tags=self._entries[k].tags, ttl=round(self._entries[k].expires - now, 3)) for k in reversed(keys)]
+
+    #返回缓存状态：
+    def stats(self):
+        return dict(name=self.name, size=len(self._entries), maxsize=self.maxsize, hits=self.hits, stale_hits=self.stale_hits, coalesced=self.coalesced, misses=self.misses, purges=self.purges, tags=len(self._tags))
+
+#URL处理函数缓存：由coroweb.cached装饰器使用，按标签清除：
+handlers = Cache('handlers')
+
+#清除带有指定标签的URL处理函数缓存：
+def purge(*tags):
+    return handlers.purge_tags(*tags)
+
+#整页缓存：缓存匿名用户的页面响应，key为地址及查询字符串，标签为地址：
+pages = Cache('pages')
+
+#清除指定地址的整页缓存(包括所有查询字符串)：
+def purge_pages(*paths):
+    return pages.purge_tags(*paths)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+响应压缩：协商Accept-Encoding并压缩响应体。
+gzip/deflate使用标准库zlib；安装了brotli或zstandard时另外支持br/zstd。
+'''
+
+import re, zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#gzip格式(wbits=31)：
+def _gzip(body, level):
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return c.compress(body) + c.flush()
+
+#HTTP的deflate实际为zlib格式：
+def _deflate(body, level):
+    return zlib.compress(body, level)
+
+def _brotli(body, level):
+    #brotli的质量为0~11，按zlib的压缩级别(1~9)折算：
+    return brotli.compress(body, quality=min(11, level + 2))
+
+def _zstd(body, level):
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+#编码名 ==> 压缩函数；只包含当前环境可用的编码：
+CODECS = dict(gzip=_gzip, deflate=_deflate)
+if brotli is not None:
+    CODECS['br'] = _brotli
+if zstandard is not None:
+    CODECS['zstd'] = _zstd
+
+#值得压缩的内容类型：
+_COMPRESSIBLE = re.compile(r'^(text/|application/(json|javascript|xml)|image/svg\+xml)')
+
+def is_compressible(content_type):
+    return content_type is not None and _COMPRESSIBLE.match(content_type) is not None
+
+#按服务器偏好顺序(preferred)选择客户端接受的编码，没有则返回None；
+#available为可用的编码，默认为当前环境可压缩的编码(CODECS)，返回预压缩文件时为已有的文件：
+def negotiate(accept_encoding, preferred, available=None):
+    if not accept_encoding:
+        return None
+    accepted = dict()
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if available is None:
+        available = CODECS
+    for name in preferred:
+        if name in available and accepted.get(name, accepted.get('*', 0)) > 0:
+            return name
+    return None
+
+#压缩响应体：
+def compress(body, encoding, level=6):
+    return CODECS[encoding](body, level)
+
+#压缩后的响应体ETag加上编码后缀，与未压缩的响应体区分：
+def encoded_etag(etag, encoding):
+    if etag.endswith('"'):
+        return '%s-%s"' % (etag[:-1], encoding)
+    return etag
+
+#去掉ETag的编码后缀：
+def strip_encoding(etag):
+    head, sep, tail = etag.rpartition('-')
+    if sep and tail[:-1] in CODECS and tail.endswith('"'):
+        return head + '"'
+    return etag
@@ -12,9 +12,115 @@ configs = {
         'port': 3306,
         'user': 'root',
         'password': '',
-        'db': 'awesome'
+        'db': 'awesome',
+        'maxsize': 10,              #(每个进程的)连接池最大连接数；多进程模式下数据库总连接数为 server.workers * maxsize
+        'minsize': 1,               #(每个进程的)连接池最小连接数
+        'warmup': 5,                #启动时预热(打开并校验)的连接数，0表示不预热
+        'acquire_timeout': 5,       #等待获取连接的超时时间(秒)
+        'pool_recycle': 3600        #连接存活超过该秒数后重建
+    },
+    'server': {
+        'host': '127.0.0.1',
+        'port': 9000,
+        'workers': 0,               #工作进程数；0表示单进程(开发环境)，N表示主进程fork出N个工作进程，通过SO_REUSEPORT共享端口
+        'heartbeat_interval': 1,    #工作进程心跳间隔(秒)
+        'heartbeat_timeout': 10,    #超过该秒数没有心跳的工作进程会被重启
+        'startup_timeout': 60,      #工作进程启动(创建并预热连接池)的超时时间(秒)
+        'drain_timeout': 10,        #停止或平滑重启时，工作进程等待正在处理的请求完成的时间(秒)
+        'shutdown_timeout': 15      #停止或平滑重启时等待工作进程退出的时间(秒)，超时则强制结束；应大于drain_timeout
     },
     'session': {
         'secret': 'Awesome'
+    },
+    'logging': {
+        'level': 'INFO',            #输出的最低级别
+        'format': 'text',           #text或json(每行一个JSON对象)
+        'async': True,              #由后台线程格式化及写入日志，事件循环线程只做入队
+        'queue_size': 10000,        #异步模式的队列长度，队列满时丢弃日志
+        'sample': {                 #按级别采样的输出比例(0~1)，未配置的级别全部输出
+            'DEBUG': 1.0,
+            'INFO': 1.0
+        }
+    },
+    'deadline': {
+        'default': 10,          #请求默认截止时间(秒)，数据库查询据此设置超时；路由可通过@get/@post的timeout参数覆盖
+        'retry_after': 1        #超时返回503时的Retry-After(秒)
+    },
+    'tracing': {
+        'sample': 0.01,             #追踪的请求比例(0~1)，0表示关闭；追踪的请求由/api/admin/traces查看
+        'buffer_size': 200,         #保存最近追踪的请求数
+        'server_timing': True       #追踪的请求返回Server-Timing响应头
+    },
+    'metrics': {
+        'enabled': True,            #统计请求、SQL及模板渲染耗时，由/metrics输出
+        'dir': '',                  #多进程模式下保存各工作进程快照的目录，默认为临时目录下的awesome-metrics-主进程号
+        'save_interval': 5          #多进程模式下工作进程保存快照的间隔(秒)
+    },
+    'query_stats': {
+        'threshold': 5          #调试模式下，单个请求内同一SQL模板执行次数超过该值则告警(N+1查询)
+    },
+    'admission': {
+        'enabled': True,        #是否启用准入控制(过载时返回503)
+        'initial_limit': 100,   #初始的同时处理请求数上限(自适应调整)
+        'min_limit': 10,        #上限的最小值
+        'max_limit': 1000,      #上限的最大值
+        'target': 0.05,         #排队时间目标(秒)；在interval秒内持续超过则认为过载
+        'interval': 0.5,        #过载判断及上限减少的间隔(秒)
+        'max_wait': 1,          #最长排队时间(秒)，超过则返回503
+        'backoff': 0.9,         #过载时上限乘以该值
+        'retry_after': 1,       #返回503时的Retry-After(秒)
+        'exempt': [r'^/static/', r'^/health$', r'^/metrics$', r'/stream$']  #不受限制的地址(正则表达式)
+    },
+    'route_classes': {
+        #@get/@post的route_class参数指定的路由类别；未指定类别的路由(普通页面及公开API)不受以下限制，
+        #且数据库连接池中至少有 db.maxsize - 各类别connections之和 个连接留给它们：
+        'admin': {
+            'concurrency': 4,       #同时处理的请求数上限
+            'max_wait': 2,          #等待名额的最长时间(秒)，超过则返回503
+            'retry_after': 2,       #返回503时的Retry-After(秒)
+            'connections': 3        #最多同时占用的数据库连接数；应小于db.maxsize
+        }
+    },
+    'rate_limits': {
+        'shared': True,             #多进程模式下各工作进程共享限速状态(共享内存)；否则每个进程各自限速
+        'maxsize': 10000,           #记录的key(用户或IP)数上限，超出时淘汰最久未使用的
+        #可信代理(如本机的nginx)的地址或网段；直连地址为可信代理时按X-Forwarded-For/X-Real-IP取客户端IP：
+        'trusted_proxies': ['127.0.0.1', '::1'],
+        #@get/@post的rate_limit参数指定的限速；rate为每秒补充的请求数，burst为最多连续的请求数：
+        'routes': {
+            'comment': {'rate': 0.2, 'burst': 5},       #发表评论
+            'register': {'rate': 0.01, 'burst': 3},     #注册
+            'signin': {'rate': 0.1, 'burst': 10}        #登录
+        }
+    },
+    'page_cache': {
+        'enabled': True,        #是否缓存匿名用户的页面
+        'paths': ['/', '/blog/'],   #缓存的页面地址；以'/'结尾的表示前缀('/'只表示首页)
+        'ttl': 5,               #页面缓存时间(秒)；多进程模式下其他进程的页面最多在ttl后刷新
+        'stale': 30,            #过期后stale秒内先返回旧页面并在后台刷新
+        'maxsize': 1000         #最多缓存的页面数
+    },
+    'compression': {
+        'enabled': True,        #是否压缩文本类响应(HTML/JSON/JS/CSS等)
+        'encodings': ['br', 'zstd', 'gzip', 'deflate'],  #按偏好顺序；br/zstd需安装brotli/zstandard，未安装则跳过
+        'level': 6,             #压缩级别(1~9)
+        'min_size': 1024,       #小于该字节数的响应不压缩
+        'executor_size': 65536  #不小于该字节数的响应在线程池中压缩
+    },
+    'json': {
+        'stream_threshold': 500,    #包含不少于该数量元素的列表的JSON响应分段编码并以chunked方式发送
+        'stream_batch': 100         #分段编码时每段的列表元素数
+    },
+    'batch': {
+        'max_requests': 20,     #单个批量请求(/api/batch)最多包含的子请求数
+        'concurrency': 4        #单个批量请求中同时执行的子请求数
+    },
+    'sse': {
+        'queue_size': 64,       #每个推送连接(Server-Sent Events)的消息队列长度，队列满(消费太慢)的连接被断开
+        'heartbeat': 15,        #推送连接的心跳间隔(秒)
+        'poll_interval': 1      #多进程模式下查询其他进程创建的新评论的间隔(秒)
+    },
+    'handler_cache': {
+        'maxsize': 1000         #@cached装饰的URL处理函数最多缓存的结果数
     }
 }
\ No newline at end of file
@@ -4,42 +4,154 @@
 WEB框架：
 '''
 
-import asyncio, os, inspect, logging, functools
+import asyncio, os, re, json, math, inspect, logging, functools, types, hashlib, mimetypes, contextvars
+
+from email.utils import formatdate
 
 from urllib import parse
 
 from aiohttp import web     #aiohttp.web 会自动创建 Request实例。
 
-from apis import APIError
+from apis import APIError, APIValueError, project
+
+import orm, cache, limits, tracing
+
+from compression import negotiate, strip_encoding
 
 #定义get装饰器；这样，一个函数通过@get()的装饰就附带了URL信息。
-def get(path):
+def get(path, timeout=None, route_class=None, rate_limit=None, batchable=True):
     '''
-    Define decorator @get('/path')
+    Define decorator @get('/path'), timeout overrides the default request deadline in seconds,
+    route_class (e.g. 'admin') limits concurrency and database connections of the route by class,
+    rate_limit (e.g. 'comment') names the per-user and per-ip rate limit of the route,
+    batchable=False rejects the route in batch requests before it runs (e.g. it sets cookies or streams).
     '''
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kw):
-            return func(*args, **kw)
-        wrapper.__method__ = 'GET'
-        wrapper.__route__ = path
-        return wrapper
+        #直接在函数上附带URL信息，不再包装一层，避免每次调用多一层调用帧：
+        func.__method__ = 'GET'
+        func.__route__ = path
+        func.__timeout__ = timeout
+        func.__route_class__ = route_class
+        func.__rate_limit__ = rate_limit
+        func.__batchable__ = batchable
+        return func
     return decorator
 
 #定义post装饰器；这样，一个函数通过@post()的装饰就附带了URL信息。
-def post(path):
+def post(path, timeout=None, route_class=None, rate_limit=None, batchable=True):
     '''
-    Define decorator @post('/path')
+    Define decorator @post('/path'), timeout overrides the default request deadline in seconds,
+    route_class (e.g. 'admin') limits concurrency and database connections of the route by class,
+    rate_limit (e.g. 'comment') names the per-user and per-ip rate limit of the route,
+    batchable=False rejects the route in batch requests before it runs (e.g. it sets cookies or streams).
     '''
     def decorator(func):
+        #直接在函数上附带URL信息，不再包装一层，避免每次调用多一层调用帧：
+        func.__method__ = 'POST'
+        func.__route__ = path
+        func.__timeout__ = timeout
+        func.__route_class__ = route_class
+        func.__rate_limit__ = rate_limit
+        func.__batchable__ = batchable
+        return func
+    return decorator
+
+#请求的字段(GET请求的?fields=a,b)：JSON结果只返回这些字段及主键id，
+#处理函数可将requested_fields()传给Model.findAll(fields=...)，只查询这些字段：
+_fields = contextvars.ContextVar('fields', default=None)
+
+_RE_FIELD = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+#返回当前请求的字段集合，未指定则返回None：
+def requested_fields():
+    return _fields.get()
+
+#解析fields参数(逗号分隔的字段名)：
+def parse_fields(s):
+    fields = frozenset(f.strip() for f in s.split(',') if f.strip())
+    if not fields or not all(_RE_FIELD.match(f) for f in fields):
+        raise APIValueError('fields', 'Invalid fields.')
+    return fields
+
+#定义cached装饰器；缓存URL处理函数的返回值(在response_factory转换为响应之前)，可与@get组合使用：
+def cached(ttl, key=None, tags=(), stale=0):
+    '''
+    Define decorator @cached(ttl=seconds), caches the handler's return value per argument set.
+    key is a callable receiving the handler's arguments (without request) and returning the cache key;
+    tags are format strings filled with the same arguments, e.g. 'blog:{id}', purged by cache.purge().
+    The cached value is shared by all users, so the handler must not depend on request.__user__.
+    '''
+    def decorator(func):
+        fn = as_coroutine_function(func)
+        name = '%s.%s' % (func.__module__, func.__qualname__)
         @functools.wraps(func)
-        def wrapper(*args, **kw):
-            return func(*args, **kw)
-        wrapper.__method__ = 'POST'
-        wrapper.__route__ = path
+        async def wrapper(**kw):
+            #request不参与缓存key：
+            args = {k: v for k, v in kw.items() if k != 'request'}
+            k = '%s:%s' % (name, key(**args) if key is not None else ','.join('%s=%s' % (n, args[n]) for n in sorted(args)))
+            #请求了部分字段时查询结果不同，字段集合加入缓存key：
+            fields = _fields.get()
+            if fields is not None:
+                k = '%s;fields=%s' % (k, ','.join(sorted(fields)))
+            loaded = False
+            async def load():
+                nonlocal loaded
+                loaded = True
+                return await fn(**kw)
+            e = await cache.handlers.get_or_load(k, load, ttl, stale, [t.format(**args) for t in tags], _is_cacheable)
+            r = e.value
+            #不可缓存的结果(响应对象)不能在并发请求之间共享，等待其他请求加载时自己重新调用：
+            if not loaded and not _is_cacheable(r):
+                return await fn(**kw)
+            #response_factory会在模板字典中加入当前用户，因此返回副本：
+            if isinstance(r, dict) and '__template__' in r:
+                return dict(r)
+            return r
         return wrapper
     return decorator
 
+#响应对象不能在请求之间共享，不缓存：
+def _is_cacheable(r):
+    return not isinstance(r, web.StreamResponse)
+
+#版本ETag的附加部分(如模板版本)，变化后所有版本ETag失效：
+_etag_salt = ''
+
+def set_etag_salt(salt):
+    global _etag_salt
+    _etag_salt = salt
+
+#根据版本号生成ETag；不同用户看到的页面不同(导航栏等)，因此混入当前用户id：
+def make_etag(request, version):
+    user = getattr(request, '__user__', None)
+    s = '%s:%s:%s' % (_etag_salt, version, user.id if user else '')
+    return '"v%s"' % hashlib.sha1(s.encode('utf-8')).hexdigest()[:24]
+
+#根据响应体生成强ETag：
+def body_etag(body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()[:24]
+
+#生成缓存验证响应头：
+def validator_headers(etag, last_modified=None):
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    return headers
+
+#判断GET请求的缓存验证条件(If-None-Match优先，其次If-Modified-Since)，满足则返回304响应，否则返回None：
+def not_modified(request, etag, last_modified=None):
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        #弱比较：忽略'W/'前缀(压缩等中间环节可能把强ETag改为弱ETag)及压缩编码后缀：
+        tags = [t.strip() for t in if_none_match.split(',')]
+        if '*' not in tags and etag not in (strip_encoding(t[2:] if t.startswith('W/') else t) for t in tags):
+            return None
+    elif last_modified is None or request.if_modified_since is None or int(last_modified) > request.if_modified_since.timestamp():
+        return None
+    return web.Response(status=304, headers=validator_headers(etag, last_modified))
+
 #获取函数传递值中的可变参数或命名关键字参数(不包含设置缺省值的)名称列表：
 def get_required_kw_args(fn):
     args = []
@@ -93,6 +205,103 @@ def has_request_arg(fn):
             raise ValueError('request parameter must be the last named parameter in function: %s%s' % (fn.__name__, str(sig)))
     return found
 
+#读取POST请求的参数；返回参数字典，请求有误则返回web.HTTPBadRequest：
+async def _read_body(request):
+    #Contern-Type 标明发送或者接收的实体的MIME类型。例如：Content-Type: text/html
+    #判断POST请求的实体MIME类型是否存在：
+    if not request.content_type:
+        #MIME类型不存在则返回错误信息：
+        return web.HTTPBadRequest(text='Missing Content-Type.')
+    #将POST请求的实体MIME类型值转换为全小写格式：
+    ct = request.content_type.lower()
+    #检查“content_type”类型是否为“application/json”开头的字符串类型：
+    if ct.startswith('application/json'):
+        #以JSON编码读取请求内容：
+        params = await request.json()  #request.json() 是个协程。
+        #判断读取的内容是否为“dict”类型；JSON的“object”类型对应的是python中的“dict”类型。
+        if not isinstance(params, dict):
+            return web.HTTPBadRequest(text='JSON body must be object.')
+        return params
+    #检查“content_type”类型是否为“application/x-www-form-urlencoded”或“multipart/form-data”开头的字符串类型：
+    if ct.startswith('application/x-www-form-urlencoded') or ct.startswith('multipart/form-data'):
+        #读取请求内容的POST参数：
+        params = await request.post()  #request.post() 是个协程。
+        return dict(**params)
+    return web.HTTPBadRequest(text='Unsupported Content-Type: %s' % request.content_type)
+
+#读取GET请求的查询字符串参数；没有查询字符串则返回None：
+def _read_query(request):
+    #获取请求URL中的查询字符串；如：“id=10”。
+    qs = request.query_string
+    if not qs:
+        return None
+    #urllib.parse.parse_qs(str)：返回解析指定字符串中的查询字符串数据字典；可选参数值“True”表示空白值保留为空白字符串，默认为忽略(False)。
+    return dict((k, v[0]) for k, v in parse.parse_qs(qs, True).items())
+
+#根据URL处理函数的签名生成参数绑定函数：binder(request)返回调用函数的参数字典，请求有误则返回web.HTTPBadRequest。
+#函数签名在注册时只分析一次，生成的binder只做该函数需要的工作：
+#   - 没有命名关键字参数和关键字参数的函数不读取查询字符串和请求体；
+#   - 路由地址中没有变量时不合并request.match_info；
+#   - 没有关键字参数时只挑选函数声明的命名关键字参数，不复制整个字典；
+#   - 必填参数用一次集合运算检查。
+def make_binder(fn, method, path):
+    has_request = has_request_arg(fn)       #判断函数传递值中是否包含“request”参数。
+    var_kw = has_var_kw_arg(fn)             #判断函数传递值中是否存在关键字参数。
+    named = get_named_kw_args(fn)           #获取函数传递值中的可变参数或命名关键字参数(全部的)名称列表。
+    required = frozenset(get_required_kw_args(fn))  #获取函数传递值中的可变参数或命名关键字参数(不包含设置缺省值的)名称列表。
+    has_match = '{' in path                 #路由地址中是否包含变量，如：'/blog/{id}'。
+
+    #从请求参数中挑选函数需要的参数：
+    if var_kw:
+        pick = dict
+    else:
+        def pick(params):
+            return dict((name, params[name]) for name in named if name in params)
+
+    #函数只需要地址变量及request参数：
+    if not (var_kw or named):
+        async def bind(request):
+            kw = dict(**request.match_info) if has_match else dict()
+            if has_request:
+                kw['request'] = request
+            return kw
+        return bind
+
+    async def bind(request):
+        if method == 'POST':
+            params = await _read_body(request)
+            if isinstance(params, web.StreamResponse):
+                return params
+        else:
+            params = _read_query(request)
+        if params is None:
+            #request.match_info：地址解析的(只读属性和抽象匹配信息实例)结果；确切的类型的属性取决于所使用的地址类型。
+            kw = dict(**request.match_info) if has_match else dict()
+        else:
+            kw = pick(params)
+            if has_match:
+                #循环出地址解析的结果字典数据并更新值到kw字典：
+                for k, v in request.match_info.items():
+                    if k in kw:
+                        logging.warning('Duplicate arg name in named arg and kw args: %s' % k)
+                    kw[k] = v
+        if has_request:
+            kw['request'] = request
+        # check required kw:
+        if required and not required.issubset(kw):
+            #传递值的参数不存在于kw字典则返回错误信息：
+            return web.HTTPBadRequest(text='Missing argument: %s' % ', '.join(sorted(required.difference(kw))))
+        return kw
+    return bind
+
+#限速的key：登录用户的id及客户端IP(经可信代理转发时为代理记录的客户端地址)：
+def rate_limit_keys(request):
+    keys = ['ip:%s' % limits.client_ip(request.remote, request.headers)]
+    user = getattr(request, '__user__', None)
+    if user is not None:
+        keys.append('user:%s' % user.id)
+    return keys
+
 #aiohttp.web的request handler实例，当url地址请求的时候就会调用。
 #封装一个URL处理函数类，由于定义了__call__()方法，因此可以将其实例视为函数：
 class RequestHandler(object):
@@ -101,104 +310,147 @@ class RequestHandler(object):
     def __init__(self, app, fn):
         self._app = app
         self._func = fn
-        self._has_request_arg = has_request_arg(fn)     #判断函数传递值中是否包含“request”参数，若有则返回True。
-        self._has_var_kw_arg = has_var_kw_arg(fn)       #判断函数传递值中是否存在关键字参数。
-        self._has_named_kw_args = has_named_kw_args(fn) #判断函数传递值中是否存在可变参数或命名关键字参数。
-        self._named_kw_args = get_named_kw_args(fn)     #获取函数传递值中的可变参数或命名关键字参数(全部的)名称列表。
-        self._required_kw_args = get_required_kw_args(fn)   #获取函数传递值中的可变参数或命名关键字参数(不包含设置缺省值的)名称列表。
-
-    #@asyncio.coroutine装饰，变成一个协程:
-    @asyncio.coroutine
-    def __call__(self, request):    #Request 实例为 aiohttp.web 自动创建的。
-        kw = None
-        #判断函数是否包含“可变参数、命名关键字参数、关键字参数”，以及是否能获取到参数(不包含缺省)名称列表：
-        if self._has_var_kw_arg or self._has_named_kw_args or self._required_kw_args:
-            #判断HTTP请求方法使用的类型：
-            if request.method == 'POST':
-                #Contern-Type 标明发送或者接收的实体的MIME类型。例如：Content-Type: text/html
-                #判断POST请求的实体MIME类型是否存在：
-                if not request.content_type:
-                    #MIME类型不存在则返回错误信息：
-                    return web.HTTPBadRequest('Missing Content-Type.')
-                #将POST请求的实体MIME类型值转换为全小写格式：
-                ct = request.content_type.lower()
-                #str.startswith(str,[strbeg(int)],[strend(int)]):检查字符串是否是以指定子字符串开头，返回True/False。若参数 beg 和 end 指定值，则在指定范围内检查。
-                #检查“content_type”类型是否为“application/json”开头的字符串类型：
-                if ct.startswith('application/json'):
-                    #以JSON编码读取请求内容：
-                    params = yield from request.json()  #request.json() 是个协程。
-                    #判断读取的内容是否为“dict”类型；JSON的“object”类型对应的是python中的“dict”类型。
-                    if not isinstance(params, dict):
-                        return web.HTTPBadRequest('JSON body must be object.')
-                    kw = params
-                #检查“content_type”类型是否为“application/x-www-form-urlencoded”或“multipart/form-data”开头的字符串类型：
-                elif ct.startswith('application/x-www-form-urlencoded') or ct.startswith('multipart/form-data'):
-                    #读取请求内容的POST参数：
-                    params = yield from request.post()  #request.post() 是个协程。
-                    #构造POST参数字典：
-                    kw = dict(**params)
-                else:
-                    return web.HTTPBadRequest('Unsupported Content-Type: %s' % request.content_type)
-            #判断HTTP请求方法使用的类型：
-            if request.method == 'GET':
-                #获取请求URL中的查询字符串；如：“id=10”。
-                qs = request.query_string
-                if qs:
-                    kw = dict()
-                    #urllib.parse.parse_qs(str)：返回解析指定字符串中的查询字符串数据字典；可选参数值“True”表示空白值保留为空白字符串，默认为忽略(False)。
-                    #循环出查询字符串数据字典并重组：
-                    for k, v in parse.parse_qs(qs, True).items():   #dict.items()返回一个由tuple(包含key,value)组成的list。
-                        kw[k] = v[0]
-        if kw is None:
-            #request.match_info：地址解析的(只读属性和抽象匹配信息实例)结果；确切的类型的属性取决于所使用的地址类型。
-            kw = dict(**request.match_info)
+        self._timeout = getattr(fn, '__timeout__', None)    #路由指定的请求截止时间(秒)，覆盖中间件设置的默认值。
+        self._route_class = getattr(fn, '__route_class__', None)   #路由类别，按类别限制并发及数据库连接数。
+        self._bulkhead = limits.bulkheads.get(self._route_class)
+        self._rate_limiter = limits.rate_limiters.get(getattr(fn, '__rate_limit__', None))
+        #注册时根据函数签名生成参数绑定函数：
+        self._bind = make_binder(fn, getattr(fn, '__method__', 'GET'), getattr(fn, '__route__', ''))
 
-        else:
-            #若函数不包含“关键字参数”且可变参数或命名关键字参数(全部的)名称列表不为空，则执行以下操作：
-            if not self._has_var_kw_arg and self._named_kw_args:
-                # remove all unamed kw:
-                copy = dict()
-                #循环出参数名称列表并重组成字典：
-                for name in self._named_kw_args:
-                    if name in kw:
-                        copy[name] = kw[name]
-                kw = copy
-            #循环出地址解析的结果字典数据并更新值到kw字典：
-            # check named arg:
-            for k, v in request.match_info.items():
-                if k in kw:
-                    #打印日志：
-                    logging.warning('Duplicate arg name in named arg and kw args: %s' % k)
-                kw[k] = v
-        #判断函数传递值中是否包含“request”参数：若包含则添加至kw字典：
-        if self._has_request_arg:
-            kw['request'] = request
-        # check required kw:
-        #获取函数传递值中的可变参数或命名关键字参数(不包含设置缺省值的)名称列表。
-        if self._required_kw_args:
-            for name in self._required_kw_args:
-                if not name in kw:
-                    #传递值的参数不存在于kw字典则返回错误信息：
-                    return web.HTTPBadRequest('Missing argument: %s' % name)
+    #async def定义为原生协程:
+    async def __call__(self, request):    #Request 实例为 aiohttp.web 自动创建的。
+        #按用户及IP限速，超过则返回429(在读取请求体之前)：
+        if self._rate_limiter is not None:
+            wait = self._rate_limiter.take(*rate_limit_keys(request))
+            if wait:
+                logging.warning('rate limited %s: %s %s', self._rate_limiter.name, request.method, request.path)
+                return web.HTTPTooManyRequests(headers={'Retry-After': str(int(math.ceil(wait)))})
+        kw = await self._bind(request)
+        if isinstance(kw, web.StreamResponse):
+            return kw
         #打印(调用函数的参数字典)日志：
-        logging.info('call with args: %s' % str(kw))
+        logging.debug('call with args: %s', kw)
+        #路由类别的并发已满，等待max_wait秒后仍没有名额则返回503：
+        if self._bulkhead is not None:
+            try:
+                await self._bulkhead.acquire()
+            except limits.Overloaded:
+                logging.warning('route class %s is full: %s %s', self._route_class, request.method, request.path)
+                return web.HTTPServiceUnavailable(headers={'Retry-After': str(self._bulkhead.retry_after)})
+        #路由指定了截止时间则覆盖默认值，数据库查询据此设置超时：
+        token = orm.set_deadline(self._timeout) if self._timeout is not None else None
+        #数据库连接按路由类别限制：
+        class_token = orm.set_route_class(self._route_class) if self._route_class is not None else None
+        fields_token = None
         try:
+            #GET请求指定了fields参数时，只返回这些字段：
+            if request.method == 'GET' and 'fields=' in request.query_string:
+                fields = request.query.get('fields')
+                if fields is not None:
+                    fields_token = _fields.set(parse_fields(fields))
             #使用重构的kw参数字典，执行函数并返回结果：
-            r = yield from self._func(**kw)
+            with tracing.span('handler', handler=self._func.__name__):
+                r = await self._func(**kw)
+            if fields_token is not None and isinstance(r, (dict, list, tuple)) and not (isinstance(r, dict) and '__template__' in r):
+                r = project(r, _fields.get())
             return r
         except APIError as e:
             #返回自定义的异常信息分类及处理信息：
             return dict(error=e.error, data=e.data, message=e.message)
+        finally:
+            if fields_token is not None:
+                _fields.reset(fields_token)
+            if token is not None:
+                orm.reset_deadline(token)
+            if class_token is not None:
+                orm.reset_route_class(class_token)
+            if self._bulkhead is not None:
+                self._bulkhead.release()
+
+#等待旧式的生成器协程(yield from写法)；types.coroutine使生成器可以被await：
+@types.coroutine
+def _await_generator(gen):
+    return (yield from gen)
+
+#把URL处理函数统一成原生协程函数，保持对旧写法处理函数的兼容：
+#   - async def定义的函数原样返回，不增加调用帧；
+#   - 普通函数的返回值直接作为结果；
+#   - 旧式的yield from生成器函数，或返回可等待对象的函数，等待其结果。
+def as_coroutine_function(fn):
+    if inspect.iscoroutinefunction(fn):
+        return fn
+    @functools.wraps(fn)
+    async def coroutine_function(*args, **kw):
+        r = fn(*args, **kw)
+        if inspect.isgenerator(r):
+            return await _await_generator(r)
+        if inspect.isawaitable(r):
+            return await r
+        return r
+    return coroutine_function
+
+#静态文件目录：
+_STATIC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+#带哈希的静态文件：原文件名 ==> static/dist/下带哈希的文件名，由build_assets.py生成：
+_manifest = dict()
+
+#加载(或重新加载)manifest.json，返回其内容的哈希，作为静态文件的版本；没有构建过则为空串：
+def load_manifest():
+    global _manifest
+    try:
+        with open(os.path.join(_STATIC_PATH, 'dist', 'manifest.json'), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        _manifest = dict()
+        return ''
+    _manifest = json.loads(data.decode('utf-8'))
+    logging.info('load %s fingerprinted assets' % len(_manifest))
+    return hashlib.sha1(data).hexdigest()[:12]
+
+#返回静态文件的地址(模板函数)；构建过则返回带哈希的文件，否则返回原文件：
+def static_url(name):
+    hashed = _manifest.get(name)
+    if hashed is None:
+        return '/static/' + name
+    return '/static/dist/' + hashed
+
+#预压缩文件的扩展名：
+_PRECOMPRESSED = dict(br='.br', gzip='.gz')
+
+#返回static/dist/下带哈希的文件：按Accept-Encoding返回预压缩的.br/.gz文件；
+#aiohttp(3.9)的静态文件处理只会返回.gz文件，因此由这里处理，其余静态文件仍由add_static()的地址返回：
+async def _static_dist(request):
+    root = os.path.join(_STATIC_PATH, 'dist')
+    path = os.path.normpath(os.path.join(root, request.match_info['name']))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    available = [name for name, ext in _PRECOMPRESSED.items() if os.path.isfile(path + ext)]
+    encoding = negotiate(request.headers.get('Accept-Encoding'), ('br', 'gzip'), available)
+    if encoding is None:
+        return web.FileResponse(path)
+    #已设置Content-Type时FileResponse不再按(预压缩文件的)扩展名猜测类型及编码：
+    ct, _ = mimetypes.guess_type(path)
+    r = web.FileResponse(path + _PRECOMPRESSED[encoding])
+    r.headers['Content-Type'] = ct or 'application/octet-stream'
+    r.headers['Content-Encoding'] = encoding
+    return r
+
+#带哈希的静态文件内容不会变化，浏览器可以长期缓存：
+async def _on_static_prepare(request, response):
+    if response.status == 200 and request.path.startswith('/static/dist/'):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers['Vary'] = 'Accept-Encoding'
 
 #添加静态地址的处理函数：
 def add_static(app):
-    #os.path.abspath(__file__)：返回当前脚本的绝对路径(包括文件名)。
-    #os.path.dirname()：去掉文件名，返回目录路径。
-    #os.path.join():将分离的各部分组合成一个路径名。
-    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    path = _STATIC_PATH
     #aiohttp.web.Application.router: 返回地址实例属性(只读)。
     #aiohttp.web.UrlDispatcher.add_static(prefix, path)-prefix：URL地址前缀；给返回的静态文件添加地址和处理程序，返回新的静态地址实例。
+    #static/dist/下的带哈希文件由_static_dist()返回，须在静态地址之前添加：
+    app.router.add_get('/static/dist/{name:.+}', _static_dist)
     app.router.add_static('/static/', path)
+    app.on_response_prepare.append(_on_static_prepare)
     #打印(添加静态地址信息)日志：
     logging.info('add static %s => %s' % ('/static/', path))
 
@@ -211,16 +463,97 @@ def add_route(app, fn):
     #若请求方式或地址信息为None则抛出异常：
     if path is None or method is None:
         raise ValueError('@get or @post not defined in %s.' % str(fn))
-    #判断函数是否为协程函数且为生成器函数：
-    if not asyncio.iscoroutinefunction(fn) and not inspect.isgeneratorfunction(fn):
-        #若不是协程函数(生成器函数)，则将其装饰成协程函数：
-        fn = asyncio.coroutine(fn)
+    #若不是原生协程函数(普通函数或旧式yield from生成器函数)，则包装成原生协程函数：
+    fn = as_coroutine_function(fn)
     #inspect.signature(fn)：返回fn函数的参数对象；inspect.signature(fn).parameters：返回包含fn函数的参数映射的字典对象。
     #打印添加地址的日志信息：
     logging.info('add route %s %s => %s(%s)' % (method, path, fn.__name__, ', '.join(inspect.signature(fn).parameters.keys())))     #dict.keys()返回一个由key(字典的目录)值组成的list
     #aiohttp.web.Application.router: 返回地址实例属性(只读)。
     #aiohttp.web.UrlDispatcher.add_route(method, path, handler):给地址增加响应规则；即设置请求条件(请求方式，地址等...)和对应的处理程序，返回新的绝对地址或动态地址。
-    app.router.add_route(method, path, RequestHandler(app, fn))
+    handler = RequestHandler(app, fn)
+    app.router.add_route(method, path, handler)
+    #记录路由，供批量请求在进程内匹配子请求；不支持批量的路由在执行之前即被拒绝：
+    app.setdefault('__routes__', []).append((method, _route_pattern(path), handler, getattr(fn, '__batchable__', True)))
+
+#把路由地址转换为正则表达式，如'/api/blogs/{id}' ==> '^/api/blogs/(?P<id>[^{}/]+)$'：
+def _route_pattern(path):
+    return re.compile('^%s$' % re.sub(r'\\\{(\w+)\\\}', r'(?P<\1>[^{}/]+)', re.escape(path)))
+
+#批量请求中的子请求：只提供RequestHandler及处理函数用到的属性，用户信息沿用所在的批量请求(只校验一次)：
+class SubRequest(object):
+    '''
+    Sub-request of a batch request, dispatched in-process to a RequestHandler.
+    '''
+
+    def __init__(self, parent, method, path, query_string, match_info, body):
+        self.app = parent.app
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.match_info = match_info
+        self.headers = parent.headers
+        self.cookies = parent.cookies
+        self.remote = parent.remote
+        self.content_type = 'application/json' if method == 'POST' else ''
+        self.__user__ = parent.__user__
+        self._body = body
+
+    @property
+    def query(self):
+        return dict(parse.parse_qsl(self.query_string, True))
+
+    async def json(self):
+        return self._body
+
+    async def post(self):
+        return self._body
+
+#在进程内执行一个子请求，返回(状态码, 结果)；结果为处理函数返回的dict等(由批量请求统一编码为JSON)：
+async def dispatch(request, method, url, body=None):
+    method = method.upper()
+    path, _, qs = url.partition('?')
+    for m, pattern, handler, batchable in request.app.get('__routes__', ()):
+        if m == method:
+            match = pattern.match(path)
+            if match is not None:
+                break
+    else:
+        return 404, dict(error='batch:notfound', data=url, message='No such API.')
+    #设置cookie、推送等不支持批量的处理函数不执行，避免产生副作用(如创建用户、消耗限速令牌)后才被拒绝：
+    if not batchable:
+        return 400, dict(error='batch:unsupported', data=url, message='API is not supported in batch.')
+    sub = SubRequest(request, method, path, qs, match.groupdict(), body if body is not None else dict())
+    try:
+        r = await handler(sub)
+    except web.HTTPException as e:
+        return e.status, dict(error='batch:http', data=url, message=e.reason)
+    #只支持返回数据的API，页面及未标记batchable=False但自行构造响应的处理函数不支持：
+    if isinstance(r, web.StreamResponse):
+        return r.status, dict(error='batch:unsupported', data=url, message='Response object is not supported in batch.')
+    if isinstance(r, dict):
+        if '__template__' in r:
+            return 400, dict(error='batch:unsupported', data=url, message='Page is not supported in batch.')
+        if '__version__' in r or '__last_modified__' in r:
+            r = {k: v for k, v in r.items() if k != '__version__' and k != '__last_modified__'}
+    return 200, r
+
+#并发执行批量请求中的子请求(最多concurrency个同时执行)，按顺序返回各子请求的dict(status=..., body=...)；
+#子请求之间没有先后顺序保证，单个子请求出错不影响其他子请求：
+async def dispatch_batch(request, items, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    async def run(item):
+        async with sem:
+            try:
+                status, body = await dispatch(request, item.get('method', 'GET'), item['url'], item.get('body'))
+            except asyncio.TimeoutError as e:
+                #子请求超过截止时间(数据库查询等)，只影响该子请求：
+                logging.warning('batch request deadline exceeded: %s: %s', item.get('url'), e)
+                status, body = 504, dict(error='batch:timeout', data=item.get('url'), message='Request timeout.')
+            except Exception:
+                logging.exception('batch request failed: %s' % item.get('url'))
+                status, body = 500, dict(error='batch:internal', data=item.get('url'), message='Internal error.')
+            return dict(status=status, body=body)
+    return await asyncio.gather(*[run(item) for item in items])
 
 #自动扫描；自动把handler模块的所有符合条件的函数注册了:
 def add_routes(app, module_name):
@@ -4,18 +4,32 @@
 URL处理器
 '''
 
-import re, time, json, logging, hashlib, base64, asyncio
+import os, re, time, logging, hashlib, base64, asyncio
 
 from aiohttp import web
 
 #导入markdown2.py文件
 import markdown2
+#导入orm.py文件
+import orm
+#导入cache.py文件
+import cache
+#导入pubsub.py文件
+import pubsub
+#导入limits.py文件
+import limits
+#导入logs.py文件
+import logs
+#导入tracing.py文件
+import tracing
+#导入metrics.py文件
+import metrics
 #导入coroweb.py文件
-from coroweb import get, post
+from coroweb import get, post, cached, make_etag, not_modified, requested_fields, dispatch_batch
 #导入models.py文件
 from models import User, Comment, Blog, next_id
 #导入apis.py文件
-from apis import APIError, APIValueError, APIResourceNotFoundError, APIPermissionError, Page
+from apis import APIError, APIValueError, APIResourceNotFoundError, APIPermissionError, Page, dumps
 #导入config.py文件
 from config import configs
 
@@ -59,8 +73,7 @@ def user2cookie(user, max_age):
     return '-'.join(L)
 
 #解析cookie处理器；
-@asyncio.coroutine      #@asyncio.coroutine装饰，变成一个协程:
-def cookie2user(cookie_str):
+async def cookie2user(cookie_str):
     '''
     Parse cookie and load user if cookie is valid.
     '''
@@ -79,7 +92,7 @@ def cookie2user(cookie_str):
         if int(expires) < time.time():
             return None
         #根据uid在数据库中查询对应的用户信息：
-        user = yield from User.find(uid)
+        user = await User.find(uid)
         #查询结果为空，则返回None：
         if user is None:
             return None
@@ -98,38 +111,109 @@ def cookie2user(cookie_str):
 
 #基础页 URL处理函数：
 @get('/')
-def index(*, page='1'):
+async def index(*, page='1'):
     #获取页面索引，默认为1；因为首页默认索引页为1，其实这里没用上：
     page_index = get_page_index(page)
     #获取数据库中的文章总数：
-    num = yield from Blog.findNumber('count(id)')
+    num = await Blog.findNumber('count(id)')
     page = Page(num, page_index)
     if num == 0:
         blogs = []
     else:
         #查询数据库中Blog表中对应分页的文章结果；(limit为mysql的分页查询条件)
-        blogs = yield from Blog.findAll(orderBy='created_at desc', limit=(page.offset, page.limit))
+        blogs = await Blog.findAll(orderBy='created_at desc', limit=(page.offset, page.limit))
     return {
         '__template__': 'blogs.html',
+        #版本：文章总数及本页文章的最后修改时间，未变化时不再渲染页面，直接返回304：
+        '__version__': '%s:%r' % (num, max((b.updated_at for b in blogs), default=0)),
         'page': page,
         'blogs': blogs
     }
 
-#指定内容页 URL处理函数：
-@get('/blog/{id}')
-def get_blog(id):
-    #通过id在数据库Blog表中查询对应内容：
-    blog = yield from Blog.find(id)
-    #通过id在数据库Comment表中查询对应内容：
-    comments = yield from Comment.findAll('blog_id=?', [id], orderBy='created_at desc')
+#单页评论数：
+COMMENT_PAGE_SIZE = 20
+
+#解析评论分页游标；游标为上一页最后一条评论的'created_at:id'：
+def parse_comment_cursor(cursor):
+    try:
+        created_at, cid = cursor.split(':', 1)
+        return float(created_at), cid
+    except ValueError:
+        raise APIValueError('cursor', 'Invalid cursor.')
+
+#按游标查询指定文章的一页评论(按创建时间倒序)，返回(评论列表, 下一页游标)；没有更多评论时游标为None：
+async def find_comments_page(blog_id, cursor=None, size=COMMENT_PAGE_SIZE):
+    where = '`blog_id`=?'
+    args = [blog_id]
+    if cursor:
+        created_at, cid = parse_comment_cursor(cursor)
+        #键集分页：只查询游标之后的评论，无需offset扫描：
+        where = where + ' and (`created_at`<? or (`created_at`=? and `id`<?))'
+        args.extend([created_at, created_at, cid])
+    #多查询一条，用于判断是否还有下一页：
+    comments = await Comment.findAll(where, args, orderBy='`created_at` desc, `id` desc', limit=size + 1)
+    next_cursor = None
+    if len(comments) > size:
+        comments = comments[:size]
+        next_cursor = '%r:%s' % (comments[-1].created_at, comments[-1].id)
     for c in comments:
         #将content值从text格式转换成html格式：
         c.html_content = text2html(c.content)
-    blog.html_content = markdown2.markdown(blog.content)
+    return comments, next_cursor
+
+#新评论推送：频道为文章id，事件id与评论分页游标相同('created_at:id')：
+comment_hub = pubsub.Hub(configs.sse.queue_size, configs.sse.heartbeat)
+
+def comment_event_id(comment):
+    return '%r:%s' % (comment.created_at, comment.id)
+
+#推送新评论给订阅该文章的连接：
+def publish_comment(comment):
+    comment.html_content = text2html(comment.content)
+    return comment_hub.publish(comment.blog_id, dumps(comment).decode('utf-8'), 'comment', comment_event_id(comment))
+
+#评论的created_at在保存之前生成，轮询时多查询该秒数内的评论，避免漏掉提交较慢的评论：
+COMMENT_POLL_OVERLAP = 5
+
+#多进程模式下评论可能由其他工作进程创建：定期查询有订阅者的文章的新评论并推送(每次一条SQL，与订阅者数量无关)；
+#Hub按事件id去重，已推送的评论不会重复推送：
+async def poll_comments(interval):
+    since = time.time()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.time()
+        ids = comment_hub.channels()
+        if ids:
+            try:
+                comments = await Comment.findAll('`blog_id` in (%s) and `created_at`>?' % ', '.join(['?'] * len(ids)), ids + [since - COMMENT_POLL_OVERLAP], orderBy='`created_at`, `id`')
+            except Exception as e:
+                logging.warning('failed to poll comments: %s' % e)
+                continue
+            for c in comments:
+                publish_comment(c)
+        since = now
+
+#指定内容页 URL处理函数；只渲染最新一页评论，其余评论由页面通过/api/blogs/{id}/comments按需加载：
+@get('/blog/{id}')
+async def get_blog(id, request):
+    #通过id在数据库Blog表中查询对应内容：
+    blog = await Blog.find(id)
+    #文章及评论未变化(updated_at未变)时直接返回304，不再查询评论及转换markdown：
+    resp = not_modified(request, make_etag(request, blog.updated_at), blog.updated_at)
+    if resp is not None:
+        resp.headers['Vary'] = 'Cookie'
+        return resp
+    #查询最新一页评论：
+    comments, cursor = await find_comments_page(id)
+    with tracing.span('markdown'):
+        blog.html_content = markdown2.markdown(blog.content)
     return {
         '__template__': 'blog.html',
+        '__version__': blog.updated_at,
+        '__last_modified__': blog.updated_at,
         'blog': blog,
-        'comments': comments
+        'comments': comments,
+        'cursor': cursor
     }
 
 #用户注册 URL处理函数：
@@ -156,12 +240,12 @@ def signout(request):
     return r
 
 #管理中心 URL处理函数：
-@get('/manage/')
+@get('/manage/', route_class='admin')
 def manage():
     return 'redirect:/manage/comments'    #重定向到执行URL。
 
 #内容(博客)管理 URL处理函数：
-@get('/manage/blogs')
+@get('/manage/blogs', route_class='admin')
 def manage_blogs(*, page='1'):
     return {
         '__template__': 'manage_blogs.html',
@@ -169,7 +253,7 @@ def manage_blogs(*, page='1'):
     }
 
 #创建内容(博客) URL处理函数：
-@get('/manage/blogs/create')
+@get('/manage/blogs/create', route_class='admin')
 def manage_create_blog():
     return {
         '__template__': 'manage_blog_edit.html',
@@ -178,7 +262,7 @@ def manage_create_blog():
     }
 
 #修改内容(博客) URL处理函数：
-@get('/manage/blogs/edit')
+@get('/manage/blogs/edit', route_class='admin')
 def manage_edit_blog(*, id):
     return {
         '__template__': 'manage_blog_edit.html',
@@ -187,7 +271,7 @@ def manage_edit_blog(*, id):
     }
 
 #评论管理 URL处理函数：
-@get('/manage/comments')
+@get('/manage/comments', route_class='admin')
 def manage_comments(*, page='1'):
     return {
         '__template__': 'manage_comments.html',
@@ -195,7 +279,7 @@ def manage_comments(*, page='1'):
     }
 
 #全部用户管理 URL处理函数：
-@get('/manage/users')
+@get('/manage/users', route_class='admin')
 def manage_users(*, page='1'):
     return {
         '__template__': 'manage_users.html',
@@ -203,64 +287,162 @@ def manage_users(*, page='1'):
     }
 
 #指定索引页评论展示 URL处理函数：
-@get('/api/comments')
-def api_comments(*, page='1'):
+@get('/api/comments', route_class='admin')
+@cached(ttl=10, tags=('comments',))
+async def api_comments(*, page='1'):
     #获取页面索引，默认为1：
     page_index = get_page_index(page)
     #查询数据库中Comment表中评论总数：
-    num = yield from Comment.findNumber('count(id)')
+    num = await Comment.findNumber('count(id)')
     p = Page(num, page_index)
     if num == 0:
         return dict(page=p, comments=())
-    comments = yield from Comment.findAll(orderBy='created_at desc', limit=(p.offset, p.limit))
+    comments = await Comment.findAll(orderBy='created_at desc', limit=(p.offset, p.limit), fields=requested_fields())
     return dict(page=p, comments=comments)
 
+#指定内容(博客)评论分页 URL处理函数：cursor为上一页返回的游标：
+@get('/api/blogs/{id}/comments')
+async def api_blog_comments(id, *, cursor='', size=str(COMMENT_PAGE_SIZE)):
+    #单页评论数限制在1~100之间：
+    size = min(max(get_page_index(size), 1), 100)
+    comments, next_cursor = await find_comments_page(id, cursor or None, size)
+    return dict(comments=comments, cursor=next_cursor)
+
+#新评论推送 URL处理函数(Server-Sent Events)：连接保持打开，有新评论时推送'comment'事件；
+#断线重连时浏览器发送Last-Event-ID，先补发此后的评论：
+@get('/api/blogs/{id}/comments/stream', batchable=False)
+async def api_blog_comments_stream(id, request):
+    resp = web.StreamResponse()
+    resp.content_type = 'text/event-stream'
+    resp.headers['Cache-Control'] = 'no-cache'
+    #禁止nginx等反向代理缓冲：
+    resp.headers['X-Accel-Buffering'] = 'no'
+    #先订阅再补发，补发期间的新评论在队列中等待，由页面按评论id去重：
+    sub = comment_hub.subscribe(id)
+    try:
+        await resp.prepare(request)
+        await resp.write(b'retry: 3000\n\n')
+        last_event_id = request.headers.get('Last-Event-ID')
+        if last_event_id:
+            created_at, cid = parse_comment_cursor(last_event_id)
+            comments = await Comment.findAll('`blog_id`=? and (`created_at`>? or (`created_at`=? and `id`>?))', [id, created_at, created_at, cid], orderBy='`created_at`, `id`', limit=COMMENT_PAGE_SIZE * 5)
+            for c in comments:
+                c.html_content = text2html(c.content)
+                await resp.write(pubsub.format_event(dumps(c).decode('utf-8'), 'comment', comment_event_id(c)))
+        while True:
+            msg = await sub.get()
+            #订阅被关闭(消费太慢或服务器停止)，结束响应，浏览器会自动重连：
+            if msg is None:
+                break
+            await resp.write(msg)
+    except (ConnectionResetError, APIError):
+        pass
+    finally:
+        comment_hub.unsubscribe(sub)
+    return resp
+
 #指定内容(博客)展示 URL处理函数：
 @get('/api/blogs/{id}')
-def api_get_blog(*, id):
-    blog = yield from Blog.find(id)
+@cached(ttl=10, tags=('blog:{id}',))
+async def api_get_blog(*, id):
+    blog = await Blog.find(id)
     return blog
 
 #指定索引页内容(博客)展示 URL处理函数：
 @get('/api/blogs')
-def api_blogs(*, page='1'):
+@cached(ttl=10, tags=('blogs',))
+async def api_blogs(*, page='1'):
     #获取页面索引，默认为1：
     page_index = get_page_index(page)
     #查询数据库中Blog表中文章总数：
-    num = yield from Blog.findNumber('count(id)')
+    num = await Blog.findNumber('count(id)')
     p = Page(num, page_index)
     if num == 0:
         return dict(page=p, blogs=())
     #查询数据库中Blog表中对应分页的文章结果；(limit为mysql的分页查询条件)
-    blogs = yield from Blog.findAll(orderBy='created_at desc', limit=(p.offset, p.limit))
+    blogs = await Blog.findAll(orderBy='created_at desc', limit=(p.offset, p.limit), fields=requested_fields())
     return dict(page=p, blogs=blogs)
 
 #指定索引页用户管理 URL处理函数：
-@get('/api/users')
-def api_get_users(*, page='1'):
+@get('/api/users', route_class='admin')
+@cached(ttl=10, tags=('users',))
+async def api_get_users(*, page='1'):
     #获取页面索引，默认为1：
     page_index = get_page_index(page)
     #查询数据库中User表中用户总数：
-    num = yield from User.findNumber('count(id)')
+    num = await User.findNumber('count(id)')
     p = Page(num, page_index)
     if num == 0:
         return dict(page=p, users=())
     #查询数据库中User表中对应分页的用户结果；(limit为mysql的分页查询条件)
-    users = yield from User.findAll(orderBy='created_at desc', limit=(p.offset, p.limit))
+    users = await User.findAll(orderBy='created_at desc', limit=(p.offset, p.limit), fields=requested_fields())
     for u in users:
         u.passwd = '******'
     return dict(page=p, users=users)
 
+#健康检查 URL处理函数：供负载均衡探测，返回处理请求的进程号：
+@get('/health')
+def health():
+    return dict(status='ok', pid=os.getpid())
+
+#指标 URL处理函数：以Prometheus文本格式返回请求、SQL及模板渲染的耗时直方图(多进程模式下为所有工作进程的合计)：
+@get('/metrics')
+def metrics_text():
+    return web.Response(body=metrics.render().encode('utf-8'), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+#运行状态 URL处理函数：返回数据库连接池监控指标：
+@get('/api/admin/stats', route_class='admin')
+def api_admin_stats(request):
+    #校验当前用户权限：
+    check_admin(request)
+    return dict(pool=orm.pool_stats(), sse=comment_hub.stats(), admission=limits.admission.stats(), route_classes=limits.bulkhead_stats(), rate_limits=limits.rate_limit_stats(), logging=logs.stats())
+
+#追踪 URL处理函数：返回最近追踪的请求(按配置的比例采样)，min_duration(毫秒)只返回耗时不少于该值的请求：
+@get('/api/admin/traces', route_class='admin')
+def api_admin_traces(request, *, limit='50', min_duration='0'):
+    #校验当前用户权限：
+    check_admin(request)
+    try:
+        limit = int(limit)
+        min_duration = float(min_duration)
+    except ValueError:
+        raise APIValueError('limit', 'limit and min_duration must be numbers.')
+    return dict(sample=tracing.tracer.sample, traces=tracing.tracer.recent(limit, min_duration))
+
+#缓存状态 URL处理函数：返回整页缓存及URL处理函数缓存的状态和最近使用的条目：
+@get('/api/admin/cache', route_class='admin')
+def api_admin_cache(request, *, limit='100'):
+    #校验当前用户权限：
+    check_admin(request)
+    limit = get_page_index(limit)
+    return dict(caches=[dict(c.stats(), entries=c.entries(limit)) for c in (cache.pages, cache.handlers)])
+
+#批量请求 URL处理函数：在一个请求中并发执行多个API请求，减少页面加载时的往返次数；
+#请求体：{"requests": [{"method": "GET", "url": "/api/blogs?page=2"}, {"method": "POST", "url": "/api/blogs/xxx/delete", "body": {...}}]}
+#返回：{"responses": [{"status": 200, "body": {...}}, ...]}，顺序与请求一致；子请求并发执行，没有先后顺序保证：
+@post('/api/batch')
+async def api_batch(request, *, requests):
+    if not isinstance(requests, list) or not requests:
+        raise APIValueError('requests', 'requests must be a non-empty list.')
+    if len(requests) > configs.batch.max_requests:
+        raise APIValueError('requests', 'At most %s requests in one batch.' % configs.batch.max_requests)
+    for item in requests:
+        url = item.get('url') if isinstance(item, dict) else None
+        if not isinstance(url, str) or not url.startswith('/api/') or url.startswith('/api/batch') or item.get('method', 'GET').upper() not in ('GET', 'POST'):
+            raise APIValueError('requests', 'Invalid request: %s' % url)
+    responses = await dispatch_batch(request, requests, configs.batch.concurrency)
+    return dict(responses=responses)
+
 #用户登陆信息校验 URL处理函数；校验用户登陆信息并返回一个带COOKIE信息的响应流：
-@post('/api/authenticate')
-def authenticate(*, email, passwd):
+@post('/api/authenticate', rate_limit='signin', batchable=False)
+async def authenticate(*, email, passwd):
     #判断email(用户名)及password是否为空；为空则抛出异常：
     if not email:
         raise APIValueError('email', 'Invalid email.')
     if not passwd:
         raise APIValueError('passwd', 'Invalid password.')
     #数据中查询对应的email信息：
-    users = yield from User.findAll('email=?', [email])
+    users = await User.findAll('email=?', [email])
     #判断查询结果是否存在，若不存在则抛出异常：
     if len(users) == 0:
         raise APIValueError('email', 'Email not exist.')
@@ -282,8 +464,8 @@ def authenticate(*, email, passwd):
     r.set_cookie(COOKIE_NAME, user2cookie(user, 86400), max_age=86400, httponly=True)
     user.passwd = '******'
     r.content_type = 'application/json'
-    #以json格式序列化响应信息； ensure_ascii默认为True，非ASCII字符也进行转义。如果为False，这些字符将保持原样。
-    r.body = json.dumps(user, ensure_ascii=False).encode('utf-8')
+    #以json格式序列化响应信息(非ASCII字符原样输出)：
+    r.body = dumps(user)
     return r
 
 #email 格式正则表达式：
@@ -292,8 +474,8 @@ _RE_EMAIL = re.compile(r'^[a-z0-9\.\-\_]+\@[a-z0-9\-\_]+(\.[a-z0-9\-\_]+){1,4}$'
 _RE_SHA1 = re.compile(r'^[0-9a-f]{40}$')
 
 #用户注册信息保存 URL处理函数；保存用户信息到数据库并返回一个带COOKIE信息的响应流：
-@post('/api/users')
-def api_register_user(*, email, name, passwd):
+@post('/api/users', rate_limit='register', batchable=False)
+async def api_register_user(*, email, name, passwd):
     #判断name是否为空：
     if not name or not name.strip():
         raise APIValueError('name')
@@ -304,7 +486,7 @@ def api_register_user(*, email, name, passwd):
     if not passwd or not _RE_SHA1.match(passwd):
         raise APIValueError('passwd')
     #数据中查询对应的email信息：
-    users = yield from User.findAll('email=?', [email])
+    users = await User.findAll('email=?', [email])
     #判断查询结果是否存在，若存在则返回异常提示邮件已存在：
     if len(users) > 0:
         raise APIError('register:failed', 'email', 'Email is already in use.')
@@ -316,7 +498,9 @@ def api_register_user(*, email, name, passwd):
     #hashlib.sha1().hexdigest():取得SHA1哈希摘要算法的摘要值。
     user = User(id=uid, name=name.strip(), email=email, passwd=hashlib.sha1(sha1_passwd.encode('utf-8')).hexdigest(), image='http://www.gravatar.com/avatar/%s?d=mm&s=120' % hashlib.md5(email.encode('utf-8')).hexdigest())
     #将用户信息存储到数据库：
-    yield from user.save()
+    await user.save()
+    #清除用户列表缓存：
+    cache.purge('users')
     # make session cookie:
     #构造session cookie信息：
     r = web.Response()
@@ -324,13 +508,13 @@ def api_register_user(*, email, name, passwd):
     r.set_cookie(COOKIE_NAME, user2cookie(user, 86400), max_age=86400, httponly=True)   #max_age：定义cookie的有效期(秒)；
     user.passwd = '******'
     r.content_type = 'application/json'
-    #以json格式序列化响应信息； ensure_ascii默认为True，非ASCII字符也进行转义。如果为False，这些字符将保持原样。
-    r.body = json.dumps(user, ensure_ascii=False).encode('utf-8')
+    #以json格式序列化响应信息(非ASCII字符原样输出)：
+    r.body = dumps(user)
     return r
 
 #创建内容(博客)保存 URL处理函数：返回Blog实例：
-@post('/api/blogs')
-def api_create_blog(request, *, name, summary, content):
+@post('/api/blogs', route_class='admin')
+async def api_create_blog(request, *, name, summary, content):
     #校验当前用户权限：
     check_admin(request)
     #校验传递值中参数‘name’是否为空或空串,为空则抛出异常：
@@ -346,16 +530,19 @@ def api_create_blog(request, *, name, summary, content):
     #创建Blog实例：
     blog = Blog(user_id=request.__user__.id, user_name=request.__user__.name, user_image=request.__user__.image, name=name.strip(), summary=summary.strip(), content=content.strip())
     #将Blog信息存储到数据库：
-    yield from blog.save()
+    await blog.save()
+    #清除首页及文章列表缓存：
+    cache.purge_pages('/')
+    cache.purge('blogs')
     return blog
 
 #更新内容(博客) URL处理函数：返回Blog实例：
-@post('/api/blogs/{id}')
-def api_update_blog(id, request, *, name, summary, content):
+@post('/api/blogs/{id}', route_class='admin')
+async def api_update_blog(id, request, *, name, summary, content):
     #校验当前用户权限：
     check_admin(request)
     #数据库Blog表中查询指定文章信息：
-    blog = yield from Blog.find(id)
+    blog = await Blog.find(id)
     #校验传递值中参数‘name’是否为空或空串,为空则抛出异常：
     if not name or not name.strip():
         raise APIValueError('name', 'name cannot be empty.')
@@ -369,24 +556,31 @@ def api_update_blog(id, request, *, name, summary, content):
     blog.name = name.strip()
     blog.summary = summary.strip()
     blog.content = content.strip()
-    #将Blog信息更新到数据库：
-    yield from blog.update()
+    blog.updated_at = time.time()
+    #将Blog信息更新到数据库；只更新编辑的字段，comment_count由评论的增删维护，不能用读取时的旧值覆盖：
+    await blog.update('name', 'summary', 'content', 'updated_at')
+    #清除首页、文章页及文章缓存：
+    cache.purge_pages('/', '/blog/%s' % id)
+    cache.purge('blogs', 'blog:%s' % id)
     return blog
 
 #删除内容(博客) URL处理函数：返回id信息dict：
-@post('/api/blogs/{id}/delete')
-def api_delete_blog(request, *, id):
+@post('/api/blogs/{id}/delete', route_class='admin')
+async def api_delete_blog(request, *, id):
     #校验当前用户权限：
     check_admin(request)
     #数据库Blog表中查询指定文章信息：
-    blog = yield from Blog.find(id)
+    blog = await Blog.find(id)
     #将Blog信息从数据库删除：
-    yield from blog.remove()
+    await blog.remove()
+    #清除首页、文章页及文章缓存：
+    cache.purge_pages('/', '/blog/%s' % id)
+    cache.purge('blogs', 'blog:%s' % id)
     return dict(id=id)
 
 #创建评论 URL处理函数：返回Comment实例：
-@post('/api/blogs/{id}/comments')
-def api_create_comment(id, request, *, content):
+@post('/api/blogs/{id}/comments', rate_limit='comment')
+async def api_create_comment(id, request, *, content):
     #获取请求中的用户信息：
     user = request.__user__
     #用户信息为None则抛出异常：
@@ -396,26 +590,45 @@ def api_create_comment(id, request, *, content):
     if not content or not content.strip():
         raise APIValueError('content')
     #数据库Blog表中查询指定文章信息：
-    blog = yield from Blog.find(id)
+    blog = await Blog.find(id)
     #查询无结果则抛出异常：
     if blog is None:
         raise APIResourceNotFoundError('Blog')
     #创建comment实例：
     comment = Comment(blog_id=blog.id, user_id=user.id, user_name=user.name, user_image=user.image, content=content.strip())
-    #将Comment信息存储到数据库：
-    yield from comment.save()
+    #在同一事务中保存Comment信息并增加文章评论数：
+    await orm.transaction(_save_comment, comment)
+    #清除文章页(评论列表)、首页(评论数)及评论、文章缓存：
+    cache.purge_pages('/', '/blog/%s' % blog.id)
+    cache.purge('comments', 'blogs', 'blog:%s' % blog.id)
+    #推送给正在浏览该文章的连接：
+    publish_comment(comment)
     return comment
 
+#保存评论并增加对应文章的评论数(需在事务中执行)：
+async def _save_comment(comment):
+    await comment.save()
+    await Blog.increase(comment.blog_id, 'comment_count', 1, updated_at=time.time())
+
+#删除评论并减少对应文章的评论数(需在事务中执行)：
+async def _remove_comment(comment):
+    #评论已被并发的删除请求删除时，不再减少评论数：
+    if await comment.remove() == 1:
+        await Blog.increase(comment.blog_id, 'comment_count', -1, updated_at=time.time())
+
 #删除评论 URL处理函数：返回id信息dict：
-@post('/api/comments/{id}/delete')
-def api_delete_comments(id, request):
+@post('/api/comments/{id}/delete', route_class='admin')
+async def api_delete_comments(id, request):
     #校验当前用户权限：
     check_admin(request)
     #数据库Comment表中查询指定评论信息：
-    c = yield from Comment.find(id)
+    c = await Comment.find(id)
     #查询无结果则抛出异常：
     if c is None:
         raise APIResourceNotFoundError('Comment')
-    #将Comment信息从数据库删除：
-    yield from c.remove()
+    #在同一事务中将Comment信息从数据库删除并减少文章评论数：
+    await orm.transaction(_remove_comment, c)
+    #清除文章页(评论列表)、首页(评论数)及评论、文章缓存：
+    cache.purge_pages('/', '/blog/%s' % c.blog_id)
+    cache.purge('comments', 'blogs', 'blog:%s' % c.blog_id)
     return dict(id=id)
\ No newline at end of file
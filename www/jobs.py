@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+后台维护任务：校正文章评论数等冗余数据。
+'''
+
+import logging; logging.basicConfig(level=logging.INFO)
+
+import asyncio, time
+
+#导入config.py文件
+from config import configs
+
+#导入orm.py文件
+import orm
+#导入models.py文件
+from models import Blog, Comment
+
+#校正文章评论数：按主键分批遍历文章，批量统计评论数，与comment_count不一致的文章重新计数：
+async def reconcile_comment_counts(batch_size=200):
+    last_id = ''
+    checked = 0
+    repaired = 0
+    while True:
+        #只取主键和评论数，避免读取文章内容：
+        blogs = await orm.select('select `id`, `comment_count` from `%s` where `id`>? order by `id` limit ?' % Blog.__table__, [last_id, batch_size])
+        if not blogs:
+            break
+        last_id = blogs[-1]['id']
+        ids = [b['id'] for b in blogs]
+        rs = await orm.select('select `blog_id`, count(`id`) _num_ from `%s` where `blog_id` in (%s) group by `blog_id`' % (Comment.__table__, orm.create_args_string(len(ids))), ids)
+        counts = dict((r['blog_id'], r['_num_']) for r in rs)
+        for b in blogs:
+            if b['comment_count'] != counts.get(b['id'], 0):
+                #在同一条语句中重新计数，避免覆盖统计之后新增/删除评论时的增减：
+                await orm.execute('update `%s` set `comment_count`=(select count(`id`) from `%s` where `blog_id`=?), `updated_at`=? where `id`=?' % (Blog.__table__, Comment.__table__), [b['id'], time.time(), b['id']])
+                logging.info('repair comment_count of blog %s: %s => %s' % (b['id'], b['comment_count'], counts.get(b['id'], 0)))
+                repaired = repaired + 1
+        checked = checked + len(blogs)
+    logging.info('reconcile comment counts done: %s checked, %s repaired.' % (checked, repaired))
+    return repaired
+
+async def main(loop):
+    await orm.create_pool(loop=loop, **configs.db)
+    try:
+        await reconcile_comment_counts()
+    finally:
+        #关闭连接池，退出时不留下未关闭的连接：
+        await orm.close_pool()
+
+if __name__ == '__main__':
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main(loop))
+    finally:
+        loop.close()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+准入控制：限制同时处理的请求数，过载时尽早拒绝(返回503)，避免请求在服务器内无限堆积。
+    - 同时处理的请求数不超过limit，超出的请求排队等待(最多max_wait秒，队列长度不超过limit)；
+    - 按CoDel的思路判断过载：排队时间在interval秒内持续超过target，则认为过载；
+      过载期间新请求不再排队直接拒绝，并把limit乘以backoff(每个interval最多一次)；
+    - 未过载且请求数达到limit时，limit缓慢增加(每完成limit个请求约加1)，即AIMD。
+另外按路由类别(@get/@post的route_class参数，如'admin')隔离并发(Bulkhead)：
+每个类别的同时处理请求数有固定上限，一个类别的慢请求不会占满整个进程。
+写操作按用户及IP限速(令牌桶，@get/@post的rate_limit参数)：
+    - 每个key(用户或IP)一个令牌桶，每秒补充rate个令牌，最多burst个；每个请求消耗一个令牌；
+    - key表有容量上限，超出时淘汰最久未使用的key，伪造大量IP不会耗尽内存；
+    - 一个请求的各key(用户及IP)都有令牌时才各取一个令牌，任一key被限速则都不扣除；
+    - 多进程模式下可使用共享内存中的key表(主进程fork之前创建)，限速对所有工作进程合计生效；
+    - 客户端IP：直连地址为可信代理(如nginx)时，取X-Forwarded-For中最右边的非可信代理地址(或X-Real-IP)。
+'''
+
+import time, mmap, struct, asyncio, hashlib, ipaddress, collections, multiprocessing
+
+class Overloaded(Exception):
+    '''
+    Raised when a request is shed by admission control.
+    '''
+    pass
+
+class AdmissionController(object):
+    '''
+    Adaptive concurrency limit with CoDel-style overload detection and AIMD adjustment.
+    '''
+
+    def __init__(self, initial_limit=100, min_limit=10, max_limit=1000, target=0.05, interval=0.5, max_wait=1.0, backoff=0.9):
+        self.configure(initial_limit, min_limit, max_limit, target, interval, max_wait, backoff)
+        self.inflight = 0
+        self.accepted = 0
+        self.shed = 0
+        self._waiters = collections.deque()
+        self._first_above = 0           #排队时间开始持续超过target的时间(0表示未超过)。
+        self._overloaded = False
+        self._last_decrease = 0
+
+    def configure(self, initial_limit=100, min_limit=10, max_limit=1000, target=0.05, interval=0.5, max_wait=1.0, backoff=0.9):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target
+        self.interval = interval
+        self.max_wait = max_wait
+        self.backoff = backoff
+
+    #准入一个请求，需要时排队；拒绝时抛出Overloaded。准入后必须调用release()：
+    async def acquire(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight = self.inflight + 1
+            self.accepted = self.accepted + 1
+            #没有排队即被准入，说明已不再过载：
+            if self._overloaded or self._first_above:
+                self._on_delay(0)
+            return
+        #过载期间或队列已满，不再排队：
+        if self._overloaded or len(self._waiters) >= int(self.limit):
+            self.shed = self.shed + 1
+            raise Overloaded()
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append(fut)
+        start = time.monotonic()
+        try:
+            await asyncio.wait((fut,), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            #请求被取消(如客户端断开)；若名额已转交过来，继续转交：
+            if fut.done():
+                self.release()
+            else:
+                fut.cancel()
+            raise
+        self._on_delay(time.monotonic() - start)
+        if not fut.done():
+            #等待超时：
+            fut.cancel()
+            self.shed = self.shed + 1
+            raise Overloaded()
+        self.accepted = self.accepted + 1
+
+    #请求处理完成，归还名额(转交给排队最久的请求)：
+    def release(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                #名额直接转交，inflight不变：
+                fut.set_result(None)
+                return
+        self.inflight = self.inflight - 1
+        #未过载且请求数达到limit：加性增加：
+        if not self._overloaded and self.inflight + 1 >= int(self.limit):
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    #根据排队时间判断是否过载(CoDel)：
+    def _on_delay(self, delay):
+        now = time.monotonic()
+        if delay < self.target:
+            self._first_above = 0
+            self._overloaded = False
+            return
+        if self._first_above == 0:
+            self._first_above = now + self.interval
+        elif now >= self._first_above:
+            self._overloaded = True
+            #乘性减少，每个interval最多一次：
+            if now - self._last_decrease >= self.interval:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def stats(self):
+        return dict(limit=round(self.limit, 2), inflight=self.inflight, queued=len(self._waiters), overloaded=self._overloaded, accepted=self.accepted, shed=self.shed)
+
+#全局准入控制：由app.admission_factory按配置设置：
+admission = AdmissionController()
+
+class Bulkhead(object):
+    '''
+    Fixed concurrency limit of a route class; waits at most max_wait seconds for a slot.
+    '''
+
+    def __init__(self, name, concurrency, max_wait=1.0, retry_after=1):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self.retry_after = retry_after      #拒绝时返回的Retry-After(秒)。
+        self.inflight = 0
+        self.shed = 0
+        self._sem = asyncio.Semaphore(concurrency)
+
+    #获取名额，max_wait秒内获取不到则抛出Overloaded。获取后必须调用release()：
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.shed = self.shed + 1
+            raise Overloaded()
+        self.inflight = self.inflight + 1
+
+    def release(self):
+        self.inflight = self.inflight - 1
+        self._sem.release()
+
+    def stats(self):
+        return dict(concurrency=self.concurrency, inflight=self.inflight, shed=self.shed)
+
+#路由类别 ==> Bulkhead；由app.create_app()按配置设置，未配置的类别不限制：
+bulkheads = dict()
+
+def add_bulkhead(name, concurrency, max_wait=1.0, retry_after=1):
+    bulkheads[name] = Bulkhead(name, concurrency, max_wait, retry_after)
+    return bulkheads[name]
+
+def bulkhead_stats():
+    return dict((name, b.stats()) for name, b in bulkheads.items())
+
+#进程内的令牌桶表：key ==> [令牌数, 更新时间]，按最近使用排序：
+class TokenBuckets(object):
+    '''
+    In-process token buckets bounded by maxsize keys with LRU eviction.
+    '''
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._buckets = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    #从各key的令牌桶各取一个令牌；全部成功返回0，否则都不扣除，返回需要等待的秒数：
+    def take(self, keys, rate, burst):
+        now = time.monotonic()
+        bs = []
+        for key in keys:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [float(burst), now]
+            else:
+                self._buckets.move_to_end(key)
+            bs.append(b)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return _take(bs, now, rate, burst)
+
+#共享内存中的令牌桶表：固定slots个槽位，每个槽位为(key的哈希值, 令牌数, 更新时间)；
+#key哈希到相邻的PROBES个槽位之一，都被其他key占用时替换最久未使用的槽位；
+#锁被其他进程持有时不等待(不阻塞事件循环)，改用本进程的令牌桶表：
+class SharedTokenBuckets(object):
+    '''
+    Token buckets in an anonymous shared memory segment, shared by processes forked after creation.
+    '''
+    SLOT = struct.Struct('Qdd')
+    PROBES = 4
+
+    def __init__(self, slots=10000):
+        self.slots = slots
+        self._mem = mmap.mmap(-1, slots * self.SLOT.size)
+        self._lock = multiprocessing.Lock()
+        self._local = TokenBuckets(slots)
+        self.contended = 0              #锁被占用、改用本进程令牌桶的次数。
+
+    def __len__(self):
+        with self._lock:
+            return sum(1 for i in range(self.slots) if self.SLOT.unpack_from(self._mem, i * self.SLOT.size)[0])
+
+    def take(self, keys, rate, burst):
+        #哈希值0表示空槽位：
+        hs = [int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1 for key in keys]
+        #锁只在读写几个槽位期间持有，被占用时不等待；持有锁的工作进程被强制结束时锁不会释放，也只退化为每个进程各自限速：
+        if not self._lock.acquire(block=False):
+            self.contended = self.contended + 1
+            return self._local.take(keys, rate, burst)
+        try:
+            #time.monotonic()为系统范围的时钟，各进程一致：
+            now = time.monotonic()
+            slots, bs = [], []
+            for h in hs:
+                slot, b = self._find(h, now, burst, slots)
+                slots.append(slot)
+                bs.append(b)
+            wait = _take(bs, now, rate, burst)
+            for h, slot, b in zip(hs, slots, bs):
+                self.SLOT.pack_into(self._mem, slot, h, b[0], b[1])
+        finally:
+            self._lock.release()
+        return wait
+
+    #返回key的哈希值h所在的槽位及令牌桶；没有则取最久未使用的槽位(不与本次请求的其他key的槽位used重复，
+    #一个请求的key数(用户及IP)少于PROBES，总有可用的槽位)：
+    def _find(self, h, now, burst, used):
+        first = h % self.slots
+        oldest = None
+        for i in range(self.PROBES):
+            offset = ((first + i) % self.slots) * self.SLOT.size
+            k, tokens, updated = self.SLOT.unpack_from(self._mem, offset)
+            if k == h:
+                return offset, [tokens, updated]
+            if offset not in used and (oldest is None or updated < oldest[1]):
+                oldest = (offset, updated)
+        return oldest[0], [float(burst), now]
+
+#各令牌桶b=[令牌数, 更新时间]补充令牌后，都有令牌时各取一个令牌返回0，否则都不扣除，返回需要等待的秒数：
+def _take(bs, now, rate, burst):
+    wait = 0
+    for b in bs:
+        b[0] = min(float(burst), b[0] + (now - b[1]) * rate)
+        b[1] = now
+        if b[0] < 1:
+            wait = max(wait, (1 - b[0]) / rate)
+    if wait:
+        return wait
+    for b in bs:
+        b[0] = b[0] - 1
+    return 0
+
+class RateLimiter(object):
+    '''
+    Token-bucket rate limit of a route, applied per key (user id and client ip).
+    '''
+
+    def __init__(self, name, rate, burst, buckets):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.limited = 0
+        self._buckets = buckets
+
+    #每个key各取一个令牌；全部成功返回0，否则都不扣除，返回需要等待的秒数：
+    def take(self, *keys):
+        wait = self._buckets.take(['%s:%s' % (self.name, key) for key in keys], self.rate, self.burst)
+        if wait:
+            self.limited = self.limited + 1
+        return wait
+
+    def stats(self):
+        return dict(rate=self.rate, burst=self.burst, limited=self.limited)
+
+#限速名称 ==> RateLimiter；由app.create_app()按配置设置，未配置的名称不限速：
+rate_limiters = dict()
+
+#可信代理(如nginx)的地址或网段，由setup_rate_limits()设置：
+trusted_proxies = ()
+
+#客户端IP：直连地址remote为可信代理时，取X-Forwarded-For中从右往左第一个非可信代理的地址
+#(更左边的地址由客户端填写，可以伪造)，没有X-Forwarded-For时取X-Real-IP；否则即为remote：
+def client_ip(remote, headers, trusted=None):
+    if trusted is None:
+        trusted = trusted_proxies
+    if not _is_trusted(remote, trusted):
+        return remote
+    forwarded = [a.strip() for a in headers.get('X-Forwarded-For', '').split(',') if a.strip()]
+    if not forwarded:
+        return headers.get('X-Real-IP', '').strip() or remote
+    for addr in reversed(forwarded):
+        if not _is_trusted(addr, trusted):
+            return addr
+    #所有地址都是可信代理：
+    return forwarded[0]
+
+def _is_trusted(addr, trusted):
+    if not addr or not trusted:
+        return False
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in trusted)
+
+#按配置创建各限速；shared为True时使用共享内存的key表(需在fork工作进程之前调用)；
+#proxies为可信代理的地址或网段(如'127.0.0.1'、'10.0.0.0/8')：
+def setup_rate_limits(routes, maxsize=10000, shared=False, proxies=()):
+    global trusted_proxies
+    trusted_proxies = tuple(ipaddress.ip_network(p, strict=False) for p in proxies)
+    buckets = SharedTokenBuckets(maxsize) if shared else TokenBuckets(maxsize)
+    rate_limiters.clear()
+    for name, conf in routes.items():
+        rate_limiters[name] = RateLimiter(name, conf['rate'], conf['burst'], buckets)
+    return buckets
+
+def rate_limit_stats():
+    return dict((name, r.stats()) for name, r in rate_limiters.items())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+日志输出：
+    - 异步模式下日志记录放入队列，由后台线程格式化并写入，事件循环线程只做入队(QueueHandler/QueueListener)；
+    - 日志消息使用logging的参数形式(logging.info('...: %s', x))，只有真正输出时才在后台线程格式化，
+      因此参数对象在记录日志后不应再被修改；
+    - 按级别采样(如INFO只输出10%)，高频日志不会拖慢请求；WARNING及以上默认全部输出；
+    - 可选JSON格式(每行一个JSON对象)，便于日志系统收集。
+多进程模式下每个工作进程在启动后各自调用setup()(后台线程不能跨fork)。
+'''
+
+import sys, json, queue, random, logging, logging.handlers
+
+#JSON格式：每条日志一行，包括时间、级别、logger名称、进程id及消息，extra参数中的字段原样输出：
+class JSONFormatter(logging.Formatter):
+    '''
+    Format a log record as a single-line JSON object.
+    '''
+    #LogRecord的标准属性，不作为extra字段输出：
+    _RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | frozenset(('message', 'asctime'))
+
+    def format(self, record):
+        d = dict(time=round(record.created, 6), level=record.levelname, logger=record.name, pid=record.process, message=record.getMessage())
+        for k, v in record.__dict__.items():
+            if k not in self._RESERVED:
+                d[k] = v
+        if record.exc_info:
+            d['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(d, ensure_ascii=False, default=str)
+
+#按级别采样：rates为级别名 ==> 输出比例(0~1)，未配置的级别全部输出：
+class SamplingFilter(logging.Filter):
+    '''
+    Keep a fraction of records per level.
+    '''
+
+    def __init__(self, rates):
+        super(SamplingFilter, self).__init__()
+        self.rates = dict((logging.getLevelName(name.upper()), rate) for name, rate in rates.items())
+        self.dropped = 0
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1 or random.random() < rate:
+            return True
+        self.dropped = self.dropped + 1
+        return False
+
+#入队时不格式化消息(由后台线程格式化)；队列已满时丢弃并计数，不阻塞事件循环：
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler that defers formatting to the listener thread and drops records when the queue is full.
+    '''
+
+    def __init__(self, q):
+        super(LazyQueueHandler, self).__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+_listener = None
+_handler = None
+_sampler = None
+
+#按配置设置根logger，日志写入stream(默认为标准错误)；返回输出日志的handler：
+def setup(conf, stream=None):
+    global _listener, _handler, _sampler
+    stop()
+    stream = logging.StreamHandler(stream or sys.stderr)
+    if conf.format == 'json':
+        stream.setFormatter(JSONFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    #输出格式不包括调用位置及线程，不再为每条日志查找调用栈帧及线程信息：
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.setLevel(conf.level)
+    if conf['async']:
+        _handler = LazyQueueHandler(queue.Queue(conf.queue_size))
+        _listener = logging.handlers.QueueListener(_handler.queue, stream)
+        _listener.start()
+    else:
+        _handler = stream
+    #采样在入队之前进行，被丢弃的日志不占用队列及后台线程：
+    _sampler = SamplingFilter(conf.sample)
+    _handler.addFilter(_sampler)
+    root.addHandler(_handler)
+    return _handler
+
+#停止后台线程，输出队列中剩余的日志(停止服务时调用)：
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def stats():
+    return dict(
+        mode='async' if _listener is not None else 'sync',
+        queued=_handler.queue.qsize() if isinstance(_handler, LazyQueueHandler) else 0,
+        dropped=_handler.dropped if isinstance(_handler, LazyQueueHandler) else 0,
+        sampled_out=_sampler.dropped if _sampler is not None else 0
+    )
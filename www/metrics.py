@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+运行指标：按路由、请求方法及状态码类别(2xx/4xx...)统计请求耗时，另外统计SQL及模板渲染耗时，
+由/metrics以Prometheus文本格式输出。
+    - 耗时直方图使用对数线性的桶：每个2倍区间再等分为SUB个桶，桶号按各桶上限二分查找得出，
+      计数保存在array中，每个直方图只占几百字节；
+    - 多进程模式下各工作进程定期把自己的直方图写入目录下的快照文件(进程号.json)，
+      /metrics合并所有快照文件输出；主进程启动时清空该目录。
+'''
+
+import os, json, array, bisect, logging
+
+#每个2倍区间等分的桶数：
+SUB = 4
+#最小及最大的2倍区间：2**MIN_EXP(约122微秒)以下计入第一个桶，2**MAX_EXP(64秒)以上计入+Inf：
+MIN_EXP = -13
+MAX_EXP = 6
+#各桶的上限(秒)：
+BOUNDS = tuple(2.0 ** (e - 1) * (1 + k / SUB) for e in range(MIN_EXP + 1, MAX_EXP + 1) for k in range(1, SUB + 1))
+
+class Histogram(object):
+    '''
+    Log-linear latency histogram backed by an array of counts.
+    '''
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        #最后一个为+Inf桶：
+        self.counts = array.array('Q', bytes(8 * (len(BOUNDS) + 1)))
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.sum = self.sum + seconds
+        #第一个上限不小于seconds的桶(Prometheus的le即小于等于)；大于所有上限时为+Inf桶：
+        self.counts[bisect.bisect_left(BOUNDS, seconds)] += 1
+
+    def merge(self, counts, sum):
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.sum = self.sum + sum
+
+    def to_list(self):
+        return [self.counts.tolist(), self.sum]
+
+#(指标名, 标签) ==> Histogram；标签为((名称, 值), ...)：
+_histograms = dict()
+
+#各指标的说明：
+HELP = dict(
+    http_request_duration_seconds='Request latency by route, method and status class.',
+    db_query_duration_seconds='Database query latency by operation.',
+    template_render_duration_seconds='Template render time by template.'
+)
+
+#记录一次耗时：
+def observe(name, labels, seconds):
+    key = (name, labels)
+    h = _histograms.get(key)
+    if h is None:
+        h = _histograms[key] = Histogram()
+    h.observe(seconds)
+
+#状态码类别：
+def status_class(status):
+    return '%dxx' % (status // 100)
+
+#多进程模式下保存快照文件的目录，由setup()设置：
+_dir = None
+
+#设置快照文件目录(多进程模式，主进程在fork之前调用)；清空旧的快照文件：
+def setup(path):
+    global _dir
+    _dir = path
+    os.makedirs(path, exist_ok=True)
+    for fn in os.listdir(path):
+        if fn.endswith('.json'):
+            os.remove(os.path.join(path, fn))
+
+#把本进程的直方图写入快照文件(先写临时文件再改名，读取时不会读到写了一半的文件)：
+def save_snapshot():
+    if _dir is None:
+        return
+    path = os.path.join(_dir, '%s.json' % os.getpid())
+    data = [[name, labels, h.to_list()] for (name, labels), h in _histograms.items()]
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+#合并所有进程的快照；单进程模式下直接返回本进程的直方图：
+def collect():
+    if _dir is None:
+        return _histograms
+    save_snapshot()
+    merged = dict()
+    for fn in os.listdir(_dir):
+        if not fn.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_dir, fn)) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning('can not read metrics snapshot %s: %s', fn, e)
+            continue
+        for name, labels, (counts, sum) in data:
+            key = (name, tuple(tuple(l) for l in labels))
+            h = merged.get(key)
+            if h is None:
+                h = merged[key] = Histogram()
+            h.merge(counts, sum)
+    return merged
+
+def _format_labels(labels, extra=None):
+    items = ['%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels]
+    if extra is not None:
+        items.append('le="%s"' % extra)
+    return '{%s}' % ','.join(items) if items else ''
+
+#以Prometheus文本格式输出所有直方图：
+def render():
+    histograms = collect()
+    lines = []
+    for name in sorted(set(name for name, labels in histograms)):
+        lines.append('# HELP %s %s' % (name, HELP.get(name, name)))
+        lines.append('# TYPE %s histogram' % name)
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            total = 0
+            for le, count in zip(BOUNDS, h.counts):
+                total = total + count
+                lines.append('%s_bucket%s %d' % (name, _format_labels(labels, '%.6g' % le), total))
+            total = total + h.counts[-1]
+            lines.append('%s_bucket%s %d' % (name, _format_labels(labels, '+Inf'), total))
+            lines.append('%s_sum%s %.6f' % (name, _format_labels(labels), h.sum))
+            lines.append('%s_count%s %d' % (name, _format_labels(labels), total))
+    return '\n'.join(lines) + '\n'
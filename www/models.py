@@ -6,7 +6,7 @@ Model: Models for user, blog, comment.
 
 import time, uuid
 
-from orm import Model, StringField, BooleanField, FloatField, TextField
+from orm import Model, StringField, BooleanField, FloatField, TextField, IntegerField
 
 #使用时间戳和UUID库结合生成唯一ID：
 def next_id():
@@ -37,7 +37,9 @@ class Blog(Model):
     name = StringField(ddl='varchar(50)')
     summary = StringField(ddl='varchar(200)')
     content = TextField()
+    comment_count = IntegerField()      #评论数，由创建/删除评论时在同一事务中维护，jobs.py定期校正。
     created_at = FloatField(default=time.time)
+    updated_at = FloatField(default=time.time)  #最后修改时间(包括评论变化)，用于生成页面及API的ETag/Last-Modified。
 
 #评论：
 class Comment(Model):
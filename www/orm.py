@@ -4,23 +4,180 @@
 ORM:对象关系映射
 '''
 
-import logging
+import logging, re, time, bisect, weakref, traceback, contextvars
+
+import tracing, metrics
 import  asyncio, aiomysql
 
 #打印SQL日志：
 def log(sql, args=()):
-    logging.info('SQL: %s' % sql)
-
-#@asyncio.coroutine可以把一个 generator 标记为 coroutine 类型
+    logging.info('SQL: %s', sql)
+
+#SQL指纹：去掉字面值、折叠空白及IN列表，使同一SQL模板得到相同的指纹：
+_RE_FP_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_RE_FP_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_FP_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_RE_FP_SPACE = re.compile(r'\s+')
+
+def fingerprint(sql):
+    '''
+    Normalize sql into a template string.
+    >>> fingerprint("select * from `blogs` where `id`='x1'  limit 10")
+    'select * from `blogs` where `id`=? limit ?'
+    >>> fingerprint('select * from t where id in (?, ?, ?)')
+    'select * from t where id in (...)'
+    '''
+    sql = _RE_FP_STRING.sub('?', sql)
+    sql = _RE_FP_NUMBER.sub('?', sql)
+    sql = _RE_FP_IN_LIST.sub('(...)', sql)
+    return _RE_FP_SPACE.sub(' ', sql).strip()
+
+#单个请求内的SQL统计，由调试模式下的中间件通过上下文变量设置：
+class QueryStats(object):
+    '''
+    Count queries per sql fingerprint during one request, warn when a template repeats too often.
+    '''
+
+    def __init__(self, threshold=5):
+        self.threshold = threshold      #同一SQL模板允许的最大执行次数，超过则告警。
+        self.total = 0                  #本次请求执行的SQL总数。
+        self.counts = dict()            #指纹 ==> 执行次数。
+        self._warned = set()            #已告警过的指纹，每个指纹只告警一次。
+
+    def record(self, sql):
+        fp = fingerprint(sql)
+        n = self.counts.get(fp, 0) + 1
+        self.counts[fp] = n
+        self.total = self.total + 1
+        #同一模板重复次数超过阈值，打印带调用栈的告警日志(通常是循环中逐行查询导致的N+1问题)：
+        if n > self.threshold and fp not in self._warned:
+            self._warned.add(fp)
+            stack = ''.join(traceback.format_stack()[:-2])
+            logging.warning('N+1 query suspected, %s executions of: %s\n%s' % (n, fp, stack))
+
+_query_stats = contextvars.ContextVar('query_stats', default=None)
+
+#开始统计当前请求的SQL；返回的token用于结束统计：
+def begin_query_stats(stats):
+    return _query_stats.set(stats)
+
+#结束统计当前请求的SQL：
+def end_query_stats(token):
+    _query_stats.reset(token)
+
+#记录一次SQL执行(未开启统计时不做任何事)：
+def _record_query(sql):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.record(sql)
+
+#连接池监控指标：连接等待时间直方图、等待超时次数、连接存活时间：
+class PoolStats(object):
+    '''
+    Checkout metrics of the connection pool.
+    '''
+    #等待时间直方图的桶上限(秒)，最后一个桶为+Inf：
+    WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.checkouts = 0                  #获取连接次数。
+        self.timeouts = 0                   #等待连接超时次数。
+        self.killed = 0                     #因超过请求截止时间而被关闭的连接数。
+        self.wait_total = 0.0               #累计等待时间。
+        self.wait_counts = [0] * (len(self.WAIT_BUCKETS) + 1)
+        self.born = weakref.WeakKeyDictionary()     #连接 ==> 首次出现时间，用于计算连接存活时间。
+
+    def observe_wait(self, seconds):
+        self.checkouts = self.checkouts + 1
+        self.wait_total = self.wait_total + seconds
+        #bisect找到第一个不小于seconds的桶：
+        self.wait_counts[bisect.bisect_left(self.WAIT_BUCKETS, seconds)] += 1
+
+    def observe_conn(self, conn):
+        if conn not in self.born:
+            self.born[conn] = time.time()
+
+    def snapshot(self, pool):
+        now = time.time()
+        ages = [now - t for t in self.born.values()]
+        buckets = [(str(le), n) for le, n in zip(self.WAIT_BUCKETS + ('+Inf',), self.wait_counts)]
+        return dict(
+            size=pool.size if pool else 0,
+            in_use=(pool.size - pool.freesize) if pool else 0,
+            idle=pool.freesize if pool else 0,
+            minsize=pool.minsize if pool else 0,
+            maxsize=pool.maxsize if pool else 0,
+            checkouts=self.checkouts,
+            timeouts=self.timeouts,
+            killed=self.killed,
+            wait_avg=(self.wait_total / self.checkouts) if self.checkouts else 0.0,
+            wait_histogram=buckets,
+            conn_age_max=max(ages) if ages else 0.0,
+            conn_age_avg=(sum(ages) / len(ages)) if ages else 0.0
+        )
+
+#查询未能在请求截止时间之前完成时抛出；继承asyncio.TimeoutError，调用方可统一按超时处理：
+class DeadlineExceeded(asyncio.TimeoutError):
+    '''
+    Raised when a query can not finish before the deadline of current request.
+    '''
+    pass
+
+#当前请求的截止时间(time.monotonic()时间)，由中间件及RequestHandler通过上下文变量设置：
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+#设置当前请求在timeout秒后截止；timeout为None表示不限制。返回的token用于恢复原截止时间：
+def set_deadline(timeout):
+    return _deadline.set(None if timeout is None else time.monotonic() + timeout)
+
+#恢复原截止时间：
+def reset_deadline(token):
+    _deadline.reset(token)
+
+#返回距离截止时间的剩余秒数，未设置截止时间则返回None：
+def _remaining():
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+__pool = None
+_pool_stats = PoolStats()
+#当前事务使用的连接，由transaction()通过上下文变量设置；事务内的select/execute都复用该连接：
+_tx_conn = contextvars.ContextVar('tx_conn', default=None)
+#等待获取连接的超时时间(秒)，由create_pool()设置：
+_acquire_timeout = None
+#当前请求的路由类别，由RequestHandler通过上下文变量设置：
+_route_class = contextvars.ContextVar('route_class', default=None)
+#路由类别 ==> 该类别最多同时占用的连接数(asyncio.Semaphore)；未设置的类别(如普通页面)不限制，
+#这样连接池中至少有 maxsize - 各类别上限之和 个连接留给未设置的类别：
+_class_limits = dict()
+_class_maxsize = dict()
+#按类别限制获取的连接 ==> 对应的Semaphore，归还连接时释放：
+_class_conns = dict()
+
+#设置路由类别name最多同时占用size个数据库连接：
+def set_connection_limit(name, size):
+    _class_limits[name] = asyncio.Semaphore(size)
+    _class_maxsize[name] = size
+
+#设置当前请求的路由类别；返回的token用于恢复：
+def set_route_class(name):
+    return _route_class.set(name)
+
+def reset_route_class(token):
+    _route_class.reset(token)
+
+#async def定义原生协程(coroutine)
 #创建全局连接池，由全局变量__pool存储：
-@asyncio.coroutine
-def create_pool(loop, **kw):
+async def create_pool(loop, **kw):
     #打印创建数据库连接日志信息：
     logging.info('create database connection pool...')
     #声明'__pool'为全局变量：
-    global __pool
+    global __pool, _acquire_timeout
+    _acquire_timeout = kw.get('acquire_timeout', None)
     #aiomysql.create_pool()创建连接到Mysql数据库池中的协程链接：
-    __pool = yield from aiomysql.create_pool(
+    __pool = await aiomysql.create_pool(
         host=kw.get('host', 'localhost'),           #数据库链接地址，默认localhost
         port=kw.get('port', 3306),                  #链接端口号，默认3306
         user=kw['user'],                            #登陆名
@@ -30,56 +187,211 @@ def create_pool(loop, **kw):
         autocommit=kw.get('autocommit', True),      #自动提交模式，默认True
         maxsize=kw.get('maxsize', 10),              #最大连接数，默认10
         minsize=kw.get('minsize', 1),               #最小连接数，默认1
+        pool_recycle=kw.get('pool_recycle', -1),    #连接存活超过该秒数后重建，默认-1(不重建)
         loop=loop                                   #可选循环实例，[aiomysql默认为asyncio.get_event_loop()]
     )
 
+#关闭连接池，等待所有连接关闭：
+async def close_pool():
+    global __pool
+    if __pool is not None:
+        __pool.close()
+        await __pool.wait_closed()
+        __pool = None
+
+#预热连接池：并发打开size个连接并逐个校验(ping)，然后归还到池中，避免启动后第一波请求承担建连开销：
+async def warm_up_pool(size):
+    size = min(size, __pool.maxsize)
+    logging.info('warm up database connection pool to %s connections...' % size)
+    conns = []
+    try:
+        for i in range(size):
+            conns.append(await _acquire())
+        for conn in conns:
+            await conn.ping()
+    finally:
+        for conn in conns:
+            _release(conn)
+    logging.info('database connection pool ready: %s' % str(pool_stats()))
+
+#返回连接池监控指标：
+def pool_stats():
+    stats = _pool_stats.snapshot(__pool)
+    #各路由类别占用的连接数：
+    stats['classes'] = dict((name, dict(maxsize=_class_maxsize[name], in_use=sum(1 for s in _class_conns.values() if s is sem))) for name, sem in _class_limits.items())
+    return stats
+
+#从连接池获取连接并记录等待时间；等待时间受_acquire_timeout及请求截止时间两者限制，超时则抛出asyncio.TimeoutError(或DeadlineExceeded)：
+async def _acquire():
+    timeout = _acquire_timeout
+    remaining = _remaining()
+    if remaining is not None:
+        #已过截止时间则不再占用连接池，直接失败，避免数据库变慢时请求排队拖垮连接池：
+        if remaining <= 0:
+            raise DeadlineExceeded('deadline exceeded before acquiring database connection')
+        if timeout is None or remaining < timeout:
+            timeout = remaining
+    sem = _class_limits.get(_route_class.get())
+    start = time.time()
+    try:
+        #先在路由类别的份额内等待，再从连接池获取连接：
+        wait = timeout
+        if sem is not None:
+            await asyncio.wait_for(sem.acquire(), timeout)
+            if timeout is not None:
+                wait = max(0, timeout - (time.time() - start))
+        try:
+            conn = await asyncio.wait_for(__pool.acquire(), wait)
+        except BaseException:
+            if sem is not None:
+                sem.release()
+            raise
+    except asyncio.TimeoutError:
+        _pool_stats.timeouts = _pool_stats.timeouts + 1
+        logging.warning('timeout while waiting for database connection: %s' % str(pool_stats()))
+        if remaining is not None and remaining <= timeout:
+            raise DeadlineExceeded('deadline exceeded while waiting for database connection')
+        raise
+    _pool_stats.observe_wait(time.time() - start)
+    _pool_stats.observe_conn(conn)
+    if sem is not None:
+        _class_conns[conn] = sem
+    return conn
+
+#归还连接到连接池：
+def _release(conn):
+    __pool.release(conn)
+    sem = _class_conns.pop(conn, None)
+    if sem is not None:
+        sem.release()
+
+#在请求截止时间之前执行coro；超时则关闭连接(连接状态已不可知，不能归还复用)，并在服务端终止查询：
+async def _run_before_deadline(conn, coro):
+    remaining = _remaining()
+    if remaining is None:
+        return await coro
+    try:
+        return await asyncio.wait_for(coro, max(remaining, 0))
+    except asyncio.TimeoutError:
+        thread_id = conn.thread_id()
+        #关闭后的连接在_release()时会被连接池丢弃：
+        conn.close()
+        _pool_stats.killed = _pool_stats.killed + 1
+        asyncio.ensure_future(_kill_query(thread_id))
+        raise DeadlineExceeded('query deadline exceeded')
+
+#在服务端终止超时的查询(尽力而为)；仅在短时间内能拿到空闲连接时执行，避免加剧连接池耗尽：
+async def _kill_query(thread_id):
+    #新任务继承了已过期的截止时间，这里清除：
+    _deadline.set(None)
+    try:
+        conn = await asyncio.wait_for(__pool.acquire(), 1)
+    except asyncio.TimeoutError:
+        logging.warning('can not kill query of connection %s: no free connection' % thread_id)
+        return
+    try:
+        cur = await conn.cursor()
+        await cur.execute('KILL QUERY %s' % int(thread_id))
+        await cur.close()
+    except Exception as e:
+        logging.warning('failed to kill query of connection %s: %s' % (thread_id, e))
+    finally:
+        __pool.release(conn)
+
 #创建Select方法
-@asyncio.coroutine
-def select(sql, args, size=None):
+async def select(sql, args, size=None):
     #打印SQL日志(查询调用时传递过来的sql语句和参数)：
     log(sql, args)
-    global __pool
-    with (yield from __pool) as conn:
-        #创建游标字典：
-        cur = yield from conn.cursor(aiomysql.DictCursor)
-        #执行SQL语句；SQL语句的占位符是?，而MySQL的占位符是%s，需要进行处理:
-        #execute(query, args=None)：query(str)-sql语句；args(list)-sql语句的替换参数列表(tuple或list)。
-        yield from cur.execute(sql.replace('?', '%s'), args or ())
-        #根据size参数判断返回结果为指定组结果集还是全部结果结果集：
-        if size:
-            #返回指定的size组结果集：
-            rs = yield from cur.fetchmany(size)
-        else:
-            #返回所有结果集：
-            rs = yield from cur.fetchall()
-        #关闭游标：
-        yield from cur.close()
-        #打印SQL执行结果日志：
-        logging.info('rows returned: %s' % len(rs))
-        return rs
+    _record_query(sql)
+    #在事务中则复用事务的连接：
+    tx = _tx_conn.get()
+    with tracing.span('db', sql=sql):
+        conn = tx or (await _acquire())
+        start = time.perf_counter()
+        try:
+            rs = await _run_before_deadline(conn, _select(conn, sql, args, size))
+            #打印SQL执行结果日志：
+            logging.info('rows returned: %s', len(rs))
+            return rs
+        finally:
+            metrics.observe('db_query_duration_seconds', (('op', 'select'),), time.perf_counter() - start)
+            if tx is None:
+                _release(conn)
+
+async def _select(conn, sql, args, size):
+    #创建游标字典：
+    cur = await conn.cursor(aiomysql.DictCursor)
+    #执行SQL语句；SQL语句的占位符是?，而MySQL的占位符是%s，需要进行处理:
+    #execute(query, args=None)：query(str)-sql语句；args(list)-sql语句的替换参数列表(tuple或list)。
+    await cur.execute(sql.replace('?', '%s'), args or ())
+    #根据size参数判断返回结果为指定组结果集还是全部结果结果集：
+    if size:
+        #返回指定的size组结果集：
+        rs = await cur.fetchmany(size)
+    else:
+        #返回所有结果集：
+        rs = await cur.fetchall()
+    #关闭游标：
+    await cur.close()
+    return rs
 
 #创建通用方法(insert，update，delete)，设置自动提交模式默认为True：
-@asyncio.coroutine
-def execute(sql, args, autocommit=True):
+async def execute(sql, args, autocommit=True):
     log(sql)
-    with (yield from __pool) as conn:
+    _record_query(sql)
+    #在事务中则复用事务的连接，由transaction()统一提交：
+    tx = _tx_conn.get()
+    with tracing.span('db', sql=sql):
+        conn = tx or (await _acquire())
+        start = time.perf_counter()
+        try:
+            return await _run_before_deadline(conn, _execute(conn, sql, args, autocommit or tx is not None))
+        finally:
+            metrics.observe('db_query_duration_seconds', (('op', 'execute'),), time.perf_counter() - start)
+            if tx is None:
+                _release(conn)
+
+async def _execute(conn, sql, args, autocommit):
+    try:
+        cur = await conn.cursor()
+        #SQL语句的占位符是?，而MySQL的占位符是%s:
+        await cur.execute(sql.replace('?', '%s'), args)
+        #返回执行后受影响的行的数量：
+        affected = cur.rowcount
+        await cur.close()
+        #判断是否自动提交：
+        if not autocommit:
+            #提交事务(仅执行查询操作时可省略)：
+            await conn.commit()
+    except BaseException as e:
+        #因截止时间被取消时连接随后会被关闭(服务端自动回滚)，此处不能再等待回滚：
+        if not autocommit and not isinstance(e, asyncio.CancelledError):
+            #有异常则回滚操作：
+            await conn.rollback()
+        raise
+    return affected
+
+#在一个事务中执行协程函数fn(*args)：fn内的select/execute使用同一连接，全部成功则提交，有异常则回滚；
+#已在事务中时直接加入外层事务：
+async def transaction(fn, *args):
+    if _tx_conn.get() is not None:
+        return await fn(*args)
+    conn = await _acquire()
+    token = _tx_conn.set(conn)
+    try:
+        await _run_before_deadline(conn, conn.begin())
         try:
-            cur = yield from conn.cursor()
-            #SQL语句的占位符是?，而MySQL的占位符是%s:
-            yield from cur.execute(sql.replace('?', '%s'), args)
-            #返回执行后受影响的行的数量：
-            affected = cur.rowcount
-            yield from cur.close()
-            #判断是否自动提交：
-            if not autocommit:
-                #提交事务(仅执行查询操作时可省略)：
-                yield from conn.commit()
+            r = await fn(*args)
+            await _run_before_deadline(conn, conn.commit())
+            return r
         except BaseException as e:
-            if not autocommit:
-                #有异常则回滚操作：
-                yield from conn.rollback()
+            #连接已因截止时间被关闭时服务端会自动回滚：
+            if not conn.closed and not isinstance(e, asyncio.CancelledError):
+                await conn.rollback()
             raise
-        return affected
+    finally:
+        _tx_conn.reset(token)
+        _release(conn)
 
 #返回指定位参数格式的字符串，如'?, ?, ?':
 def create_args_string(num):
@@ -226,15 +538,15 @@ class Model(dict, metaclass = ModelMetaclass):
 
 #-------------往Model类添加class方法，就可以让所有子类调用class方法：---------------#
     #classmethod是用来指定一个类的方法为类方法，没有此参数指定的类的方法为实例方法，类方法既可以直接类调用(C.f())，也可以进行实例调用(C().f())。：
-    #所有这些方法都用@asyncio.coroutine装饰，变成一个协程:
+    #所有这些方法都用async def定义，是原生协程:
 
     #实现条件查询：返回所有结果的list，结果为空返回None：
     @classmethod
-    @asyncio.coroutine
-    def findAll(cls, where=None, args=None, **kw):
-        ' find objects by where clause. '
-        #创建sql数组：
-        sql = [cls.__select__]
+    async def findAll(cls, where=None, args=None, **kw):
+        ' find objects by where clause, fields limits the selected columns (primary key is always selected). '
+        #创建sql数组；指定了fields(属性名集合)则只查询这些字段及主键：
+        fields = kw.get('fields', None)
+        sql = [cls.__select__ if fields is None else cls._select_fields(fields)]
         #将查询条件添加到sql数组中：
         if where:
             sql.append('where')
@@ -266,13 +578,18 @@ class Model(dict, metaclass = ModelMetaclass):
             else:
                 raise ValueError('Invalid limit value: %s' % str(limit))
         #调用select()实现对数据库进行select操作：
-        rs = yield from select(' '.join(sql), args)
+        rs = await select(' '.join(sql), args)
         return [cls(**r) for r in rs]
 
+    #构建只查询指定字段(及主键)的select语句；不存在的字段忽略：
+    @classmethod
+    def _select_fields(cls, fields):
+        names = [f for f in cls.__fields__ if f in fields]
+        return 'select `%s`%s from `%s`' % (cls.__primary_key__, ''.join(', `%s`' % f for f in names), cls.__table__)
+
     #实现条件查询：返回单个结果，结果为空返回None：
     @classmethod
-    @asyncio.coroutine
-    def findNumber(cls, selectField, where=None, args=None):
+    async def findNumber(cls, selectField, where=None, args=None):
         ' find number by select and where. '
         #构建sql数组：'_num_' 为自定义sql查询结果列名
         sql = ['select %s _num_ from `%s`' % (selectField, cls.__table__)]
@@ -281,59 +598,74 @@ class Model(dict, metaclass = ModelMetaclass):
             sql.append('where')
             sql.append(where)
             #调用select()实现对数据库进行select操作：
-        rs = yield from select(' '.join(sql), args, 1)  #将sql数组拼接成sql语句
+        rs = await select(' '.join(sql), args, 1)  #将sql数组拼接成sql语句
         if len(rs) == 0:
             return None
         return rs[0]['_num_']
 
     #实现主键查询：返回单个对象，若结果为空返回None：
     @classmethod
-    @asyncio.coroutine
-    def find(cls, pk):
+    async def find(cls, pk):
         ' find object by primary key. '
         #调用select()实现对数据库进行select操作：
-        rs = yield from select('%s where `%s`=?' % (cls.__select__, cls.__primary_key__), [pk], 1)
+        rs = await select('%s where `%s`=?' % (cls.__select__, cls.__primary_key__), [pk], 1)
         if len(rs) == 0:
             return None
         return cls(**rs[0])
 
 
+    #实现字段原子增减：返回受影响行数：
+    @classmethod
+    async def increase(cls, pk, field, n=1, **values):
+        ' increase numeric field by primary key, optionally setting other fields in the same statement. '
+        #构建sql语句，由数据库完成加减，避免读-改-写的并发覆盖：
+        names = list(values)
+        sql = 'update `%s` set `%s`=`%s`+?%s where `%s`=?' % (cls.__table__, field, field, ''.join(', `%s`=?' % k for k in names), cls.__primary_key__)
+        rows = await execute(sql, [n] + [values[k] for k in names] + [pk])
+        if rows != 1:
+            logging.warn('failed to increase %s by primary key: affected rows: %s' % (field, rows))
+        return rows
+
+
 #-------------往Model类添加实例方法，就可以让所有子类调用实例方法：---------------#
-    #所有这些方法都用@asyncio.coroutine装饰，变成一个协程:
+    #所有这些方法都用async def定义，是原生协程:
 
     #实现数据插入：
-    @asyncio.coroutine
-    def save(self):
+    async def save(self):
         #构建args属性值(__fields__不包括主键)list，没有的则赋值为初始默认值：
         args = list(map(self.getValueOrDefault, self.__fields__))
         #增加主键值到args中，没有则赋值为初始默认值：
         args.append(self.getValueOrDefault(self.__primary_key__))
         #调用execute()实现对数据库进行insert操作：
-        rows = yield from execute(self.__insert__, args)    #返回受影响行数
+        rows = await execute(self.__insert__, args)    #返回受影响行数
         if rows != 1:
             #若返回值不等于1，则打印日志：
             logging.warn('failed to insert record: affected rows: %s' % rows)
 
-    #实现数据更新：
-    @asyncio.coroutine
-    def update(self):
+    #实现数据更新；指定fields时只更新这些字段，其余字段(如由increase()维护的计数)不会被读取时的旧值覆盖：
+    async def update(self, *fields):
+        fields = fields or self.__fields__
+        sql = self.__update__
+        if fields is not self.__fields__:
+            sql = 'update `%s` set %s where `%s`=?' % (self.__table__, ', '.join('`%s`=?' % (self.__mappings__[f].name or f) for f in fields), self.__primary_key__)
         #构建args属性值(__fields__不包括主键)list，找不到时value为None：
-        args = list(map(self.getValue, self.__fields__))
+        args = list(map(self.getValue, fields))
         #增加主键值到args中，找不到时value为None：
         args.append(self.getValue(self.__primary_key__))
         #调用execute()实现对数据库进行update操作：
-        rows = yield from execute(self.__update__, args)
+        rows = await execute(sql, args)
         if rows != 1:
             #若返回值不等于1，则打印日志：
             logging.warn('failed to update by primary key: affected rows: %s' % rows)
+        return rows
 
     #实现数据删除：
-    @asyncio.coroutine
-    def remove(self):
+    async def remove(self):
         #构建args属性值(主键)list，找不到时value为None：
         args = [self.getValue(self.__primary_key__)]
         #调用execute()实现对数据库进行delete操作：
-        rows = yield from execute(self.__delete__, args)
+        rows = await execute(self.__delete__, args)
         if rows != 1:
             #若返回值不等于1，则打印日志：
             logging.warn('failed to remove by primary key: affected rows: %s' % rows)
+        return rows
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+多进程服务：主进程(supervisor)fork出多个工作进程，工作进程通过SO_REUSEPORT监听同一端口，
+由内核在各进程间分配连接；主进程通过心跳检查工作进程是否存活，崩溃或卡死的工作进程会被重启。
+主进程收到的SIGUSR1(重新加载模板)转发给所有工作进程。
+
+平滑重启(reload)：主进程收到SIGHUP后，
+    1. 检查源代码能否编译，有语法错误则放弃本次重启；
+    2. 主进程以原进程号重新执行自身(os.execv)，加载新代码；旧工作进程仍是它的子进程，继续处理请求；
+    3. 新主进程fork新一代工作进程，它们预热数据库连接池和模板后才通过SO_REUSEPORT绑定同一端口，开始接受连接
+       (绑定后内核即开始把连接分配给该进程，预热期间或启动失败时这些连接会等待或被重置)；
+    4. 新一代工作进程全部就绪(发出首次心跳)后，向旧工作进程发送SIGTERM；
+       旧工作进程停止接受连接，等待正在处理的请求完成(最多drain_timeout秒)后退出。
+'''
+
+import os, gc, sys, time, errno, fcntl, select, signal, socket, logging, functools
+
+from collections import deque
+
+#创建监听socket；reuse_port为True时设置SO_REUSEPORT，多个进程可以各自绑定同一地址：
+def create_socket(host, port, reuse_port=True, backlog=128):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+#工作进程的心跳：由工作进程的事件循环定时向管道写入一个字节，能写入说明事件循环没有被阻塞：
+class Heartbeat(object):
+    '''
+    Write a byte into the supervisor pipe every interval seconds from the event loop.
+    '''
+
+    def __init__(self, fd, interval):
+        self._fd = fd
+        self._interval = interval
+        self._handle = None
+
+    def start(self, loop):
+        self._loop = loop
+        self._beat()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _beat(self):
+        try:
+            os.write(self._fd, b'.')
+        except BlockingIOError:
+            #管道已满说明主进程还没来得及读取，跳过本次心跳即可：
+            pass
+        except BrokenPipeError:
+            #主进程已重新执行(平滑重启)，本进程即将被新主进程结束，不再发送心跳：
+            return
+        self._handle = self._loop.call_later(self._interval, self._beat)
+
+#检查目录下的Python源文件能否编译，返回[(文件名, 错误信息)]：
+def check_sources(path):
+    errors = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.py'):
+            continue
+        fn = os.path.join(path, name)
+        try:
+            with open(fn, 'rb') as f:
+                compile(f.read(), fn, 'exec')
+        except (SyntaxError, ValueError) as e:
+            errors.append((fn, str(e)))
+    return errors
+
+#主进程重新执行时，通过该环境变量把需要退役的旧工作进程号传给新主进程：
+RETIRE_ENV = 'AWESOME_RETIRE_PIDS'
+#单进程模式重新执行时，通过该环境变量把监听socket的文件描述符传给新进程：
+LISTEN_FD_ENV = 'AWESOME_LISTEN_FD'
+
+#保留监听socket供重新执行后的进程使用：复制文件描述符(原socket关闭后内核中的监听socket仍然存在，
+#新连接在监听队列中等待，不会被拒绝)，并设置为可被execve继承；返回需要传给reexec()的环境变量：
+def keep_socket(sock):
+    fd = os.dup(sock.fileno())
+    os.set_inheritable(fd, True)
+    env = dict(os.environ)
+    env[LISTEN_FD_ENV] = str(fd)
+    return env
+
+#取得重新执行前保留的监听socket，没有则返回None：
+def inherit_socket():
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is None:
+        return None
+    sock = socket.socket(fileno=int(fd))
+    os.set_inheritable(sock.fileno(), False)
+    sock.setblocking(False)
+    return sock
+
+#平滑重启相关的信号：execve会把已设置处理函数的信号恢复为默认处理(结束进程)，而被忽略的信号保持忽略；
+#因此重新执行前先忽略这些信号，新进程启动后立即改为记录(defer_signals)，安装处理函数之后再补发(replay_signals)：
+RELOAD_SIGNALS = (signal.SIGHUP, signal.SIGUSR1)
+_deferred = []
+
+def defer_signals():
+    for sig in RELOAD_SIGNALS:
+        signal.signal(sig, _defer)
+
+def _defer(signum, frame):
+    if signum not in _deferred:
+        _deferred.append(signum)
+
+#补发安装处理函数之前收到的信号：
+def replay_signals():
+    while _deferred:
+        signal.raise_signal(_deferred.pop(0))
+
+#平滑重启：检查源代码后以原进程号重新执行当前程序；源代码有错误时返回False：
+def reexec(env=None):
+    path = os.path.dirname(os.path.abspath(sys.argv[0]))
+    errors = check_sources(path)
+    if errors:
+        for fn, err in errors:
+            logging.error('reload aborted, can not compile %s: %s' % (fn, err))
+        return False
+    logging.info('reloading: exec %s %s...' % (sys.executable, ' '.join(sys.argv)))
+    logging.shutdown()
+    for sig in RELOAD_SIGNALS:
+        signal.signal(sig, signal.SIG_IGN)
+    os.execve(sys.executable, [sys.executable] + sys.argv, env or os.environ)
+
+#主进程记录的工作进程信息：
+class WorkerProcess(object):
+
+    def __init__(self, pid, fd):
+        self.pid = pid
+        self.fd = fd                        #心跳管道的读端。
+        self.started_at = time.monotonic()
+        self.last_beat = None               #最近一次心跳时间，None表示尚未启动完成。
+        self.killed = False
+
+#主进程：fork并监控工作进程：
+class Supervisor(object):
+    '''
+    Fork workers, restart them on crash or missed heartbeats, stop them on SIGTERM/SIGINT.
+    '''
+
+    def __init__(self, worker, server):
+        self._worker = worker           #工作进程入口：worker(sock, heartbeat)，sock为监听socket或创建监听socket的函数。
+        self._server = server           #configs.server
+        self._workers = dict()          #pid ==> WorkerProcess
+        self._stopping = False
+        self._stop_deadline = None
+        self._crashes = deque(maxlen=server.workers)   #最近的异常退出时间，用于判断是否频繁崩溃。
+        self._reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self._shared_sock = None
+        self._reload_requested = False
+        #平滑重启前的旧工作进程号，等待新一代工作进程就绪后退役：
+        self._pending_retire = [int(pid) for pid in os.environ.pop(RETIRE_ENV, '').split(',') if pid]
+        #已通知退出的旧工作进程：pid ==> 强制结束的时间：
+        self._retiring = dict()
+
+    def run(self):
+        server = self._server
+        if self._pending_retire:
+            logging.info('supervisor %s reloaded, old workers: %s' % (os.getpid(), self._pending_retire))
+        if self._reuse_port:
+            #在fork之前检查端口是否可用，避免所有工作进程启动后才失败：
+            create_socket(server.host, server.port).close()
+        else:
+            #系统不支持SO_REUSEPORT时，由主进程创建监听socket，工作进程继承后共同accept：
+            logging.warning('SO_REUSEPORT is not supported, workers share one listening socket.')
+            self._shared_sock = create_socket(server.host, server.port, reuse_port=False)
+        #fork之前把已导入模块、模板等对象移入永久代，垃圾回收不再扫描(修改引用计数之外的)这些对象，
+        #使其所在的内存页在各工作进程间保持写时复制共享：
+        gc.collect()
+        gc.freeze()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGUSR1, self._on_forward)
+        replay_signals()
+        logging.info('supervisor %s starting %s workers at http://%s:%s...' % (os.getpid(), server.workers, server.host, server.port))
+        for i in range(server.workers):
+            self.spawn()
+        while self._workers or self._retiring:
+            self._wait_heartbeats(server.heartbeat_interval)
+            self._reap()
+            if self._stopping:
+                self._check_stop()
+            else:
+                self._check_health()
+                self._replenish()
+                self._retire()
+                if self._reload_requested:
+                    self._reload()
+        logging.info('supervisor %s exit.' % os.getpid())
+
+    #fork一个工作进程：
+    def spawn(self):
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            #子进程：恢复默认信号处理，运行工作进程入口，结束时直接退出，不执行主进程的清理逻辑：
+            code = 0
+            try:
+                os.close(rfd)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+                fcntl.fcntl(wfd, fcntl.F_SETFL, fcntl.fcntl(wfd, fcntl.F_GETFL) | os.O_NONBLOCK)
+                #每个工作进程预热完成后绑定自己的监听socket(SO_REUSEPORT)，或使用继承的共享socket：
+                sock = self._shared_sock or functools.partial(create_socket, self._server.host, self._server.port)
+                self._worker(sock, Heartbeat(wfd, self._server.heartbeat_interval))
+            except BaseException as e:
+                logging.exception(e)
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(wfd)
+        self._workers[pid] = WorkerProcess(pid, rfd)
+        logging.info('worker %s started.' % pid)
+        return pid
+
+    #停止所有工作进程(SIGTERM)；超过shutdown_timeout仍未退出则强制结束：
+    def stop(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        self._stop_deadline = time.monotonic() + self._server.shutdown_timeout
+        for w in self._workers.values():
+            self._kill(w.pid, signal.SIGTERM)
+        #尚未退役的旧工作进程一并停止：
+        for pid in self._pending_retire:
+            self._retiring[pid] = self._stop_deadline
+            self._kill(pid, signal.SIGTERM)
+        self._pending_retire = []
+
+    def _on_stop(self, signum, frame):
+        logging.info('supervisor received signal %s, stopping workers...' % signum)
+        self.stop()
+
+    def _on_reload(self, signum, frame):
+        logging.info('supervisor received signal %s, reloading...' % signum)
+        self._reload_requested = True
+
+    #转发信号给所有工作进程(SIGUSR1：重新加载模板)：
+    def _on_forward(self, signum, frame):
+        for pid in self._workers.keys():
+            self._kill(pid, signum)
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    #平滑重启：上一次重启的旧工作进程退役之前不再重启；源代码有错误时放弃重启，继续使用当前工作进程：
+    def _reload(self):
+        if self._pending_retire:
+            return
+        self._reload_requested = False
+        pids = list(self._workers.keys()) + list(self._retiring.keys())
+        env = dict(os.environ)
+        env[RETIRE_ENV] = ','.join(str(pid) for pid in pids)
+        reexec(env)
+
+    #新一代工作进程全部就绪后，让旧工作进程退出(SIGTERM)；超过shutdown_timeout仍未退出则强制结束：
+    def _retire(self):
+        now = time.monotonic()
+        if self._pending_retire:
+            ready = len(self._workers) >= self._server.workers and all(w.last_beat is not None for w in self._workers.values())
+            if ready:
+                logging.info('new workers ready, retiring old workers: %s' % self._pending_retire)
+                for pid in self._pending_retire:
+                    self._retiring[pid] = now + self._server.shutdown_timeout
+                    self._kill(pid, signal.SIGTERM)
+                self._pending_retire = []
+        for pid, deadline in self._retiring.items():
+            if now > deadline:
+                logging.warning('old worker %s did not stop in time, killing...' % pid)
+                self._kill(pid, signal.SIGKILL)
+
+    #等待并读取心跳，最多等待timeout秒：
+    def _wait_heartbeats(self, timeout):
+        fds = dict((w.fd, w) for w in self._workers.values())
+        try:
+            readable, _, _ = select.select(list(fds.keys()), [], [], timeout)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+            return
+        now = time.monotonic()
+        for fd in readable:
+            #读到空数据说明管道写端已关闭(进程已退出)，由_reap()回收：
+            if os.read(fd, 4096):
+                fds[fd].last_beat = now
+
+    #回收已退出的工作进程：
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self._retiring or pid in self._pending_retire:
+                logging.info('old worker %s exited with code %s.' % (pid, os.waitstatus_to_exitcode(status)))
+                self._retiring.pop(pid, None)
+                if pid in self._pending_retire:
+                    self._pending_retire.remove(pid)
+                continue
+            w = self._workers.pop(pid, None)
+            if w is None:
+                continue
+            os.close(w.fd)
+            code = os.waitstatus_to_exitcode(status)
+            if self._stopping:
+                logging.info('worker %s exited with code %s.' % (pid, code))
+            else:
+                logging.warning('worker %s died with code %s, restarting...' % (pid, code))
+                self._crashes.append(time.monotonic())
+
+    #检查心跳：启动超时或心跳超时的工作进程被强制结束，回收后重启：
+    def _check_health(self):
+        now = time.monotonic()
+        for w in self._workers.values():
+            if w.killed:
+                continue
+            if w.last_beat is None:
+                stalled = now - w.started_at > self._server.startup_timeout
+            else:
+                stalled = now - w.last_beat > self._server.heartbeat_timeout
+            if stalled:
+                logging.warning('worker %s missed heartbeats, killing...' % w.pid)
+                w.killed = True
+                self._kill(w.pid, signal.SIGKILL)
+
+    #补足工作进程；短时间内所有工作进程都崩溃过时暂缓重启，避免崩溃-重启循环占满CPU：
+    def _replenish(self):
+        if len(self._crashes) == self._crashes.maxlen and time.monotonic() - self._crashes[0] < self._server.heartbeat_timeout:
+            logging.warning('workers are crashing repeatedly, backing off...')
+            time.sleep(1)
+        while len(self._workers) < self._server.workers:
+            self.spawn()
+
+    def _check_stop(self):
+        if time.monotonic() > self._stop_deadline:
+            for pid in self._retiring.keys():
+                self._kill(pid, signal.SIGKILL)
+            for w in self._workers.values():
+                if not w.killed:
+                    logging.warning('worker %s did not stop in time, killing...' % w.pid)
+                    w.killed = True
+                    self._kill(w.pid, signal.SIGKILL)
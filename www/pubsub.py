@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+进程内的发布/订阅：按频道把事件推送给订阅者(如Server-Sent Events连接)。
+    - 事件只编码一次，所有订阅者共享同一份bytes；
+    - 每个订阅者的队列有上限，队列满(消费太慢)的订阅者被断开，由客户端重连；
+    - 心跳由Hub的一个任务统一发送，空闲连接不需要各自的定时器；
+    - 最近发布的事件id去重，同一事件从多个来源(本进程发布及轮询数据库)到达时只推送一次。
+多进程模式下每个工作进程各有一个Hub，其他进程产生的事件需由调用方另行获取(如轮询数据库)后发布。
+'''
+
+import asyncio, logging
+
+from collections import OrderedDict
+
+#心跳：SSE的注释行，保持连接不被代理断开：
+PING = b': ping\n\n'
+
+#格式化SSE事件：
+def format_event(data, event=None, id=None):
+    lines = []
+    if id is not None:
+        lines.append('id: %s' % id)
+    if event is not None:
+        lines.append('event: %s' % event)
+    for line in data.splitlines() or ['']:
+        lines.append('data: %s' % line)
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+#订阅者：
+class Subscription(object):
+    __slots__ = ('channel', 'closed', '_queue')
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.closed = False
+        self._queue = asyncio.Queue(maxsize)
+
+    #放入消息，队列已满返回False：
+    def put(self, msg):
+        try:
+            self._queue.put_nowait(msg)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    #返回下一条消息(bytes)；订阅已关闭则返回None：
+    async def get(self):
+        if self.closed:
+            return None
+        msg = await self._queue.get()
+        if self.closed:
+            return None
+        return msg
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            #唤醒等待中的get()；队列满时get()不会阻塞，取出消息后检查closed：
+            self.put(None)
+
+class Hub(object):
+    '''
+    In-process pub/sub fan-out with bounded per-subscriber queues and a shared heartbeat.
+    '''
+
+    def __init__(self, queue_size=64, heartbeat=15, seen_size=1024):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._channels = dict()             #channel ==> set(Subscription)
+        self._seen = OrderedDict()          #最近发布的事件id，用于去重。
+        self._seen_size = seen_size
+        self._task = None
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, channel):
+        sub = Subscription(channel, self.queue_size)
+        self._channels.setdefault(channel, set()).add(sub)
+        if self._task is None and self.heartbeat:
+            self._task = asyncio.ensure_future(self._ping())
+        return sub
+
+    def unsubscribe(self, sub):
+        sub.close()
+        subs = self._channels.get(sub.channel)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._channels[sub.channel]
+
+    #有订阅者的频道：
+    def channels(self):
+        return list(self._channels)
+
+    def count(self):
+        return sum(len(subs) for subs in self._channels.values())
+
+    #发布事件，返回推送到的订阅者数；id已发布过的事件忽略：
+    def publish(self, channel, data, event=None, id=None):
+        if id is not None:
+            if id in self._seen:
+                return 0
+            self._seen[id] = True
+            if len(self._seen) > self._seen_size:
+                self._seen.popitem(last=False)
+        subs = self._channels.get(channel)
+        if not subs:
+            return 0
+        msg = format_event(data, event, id)
+        n = 0
+        for sub in list(subs):
+            if sub.put(msg):
+                n = n + 1
+            else:
+                #队列已满，断开消费太慢的订阅者：
+                logging.warning('drop slow subscriber of %s' % channel)
+                self.dropped = self.dropped + 1
+                self.unsubscribe(sub)
+        self.published = self.published + 1
+        return n
+
+    async def _ping(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subs in list(self._channels.values()):
+                for sub in list(subs):
+                    #队列中还有消息的订阅者不需要心跳：
+                    if sub._queue.empty():
+                        sub.put(PING)
+
+    #关闭所有订阅(停止服务时调用)，订阅者的get()返回None：
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for subs in list(self._channels.values()):
+            for sub in list(subs):
+                self.unsubscribe(sub)
+
+    def stats(self):
+        return dict(channels=len(self._channels), subscribers=self.count(), published=self.published, dropped=self.dropped)
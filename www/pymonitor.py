@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 '''
-目录文件监控程序：时刻监控www目录下的代码改动，有改动时，先把当前wsgiapp.py进程杀掉，再重启，就完成了服务器进程的自动重启。
+目录文件监控程序：时刻监控www目录下的代码改动，有改动时向服务器进程发送SIGHUP，由服务器平滑重启：
+多进程模式下新工作进程就绪后旧工作进程才停止接受连接；单进程模式下服务器处理完正在处理的请求后重新执行自身，
+监听socket保持打开，重启期间到达的连接在监听队列中等待，不会被拒绝。服务器进程已退出时重新启动。
+
+文件改动先合并：最后一次改动之后DEBOUNCE秒内没有新的改动，才按文件类型处理这一批改动：
+    - Python源文件：先检查语法，有错误则不重启，服务器继续运行；
+    - 模板文件：向服务器发送SIGUSR1，原地重新加载模板，无需重启；
+    - 静态文件：直接从磁盘读取，无需处理。
 '''
 
 __author__ = 'Michael Liao'     #作者
 
-import os, sys, time, subprocess
+import os, sys, time, signal, threading, subprocess
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -14,16 +21,86 @@ from watchdog.events import FileSystemEventHandler
 def log(s):
     print('[Monitor] %s' % s)
 
+#合并改动的时间窗口(秒)：编辑器保存一次文件通常会产生多个事件：
+DEBOUNCE = 0.5
+#忽略编辑器临时文件、备份文件及编译缓存：
+IGNORE_SUFFIXES = ('~', '.swp', '.swx', '.swpx', '.tmp', '.pyc', '.pyo')
+IGNORE_DIRS = ('__pycache__', '.git')
+
+def is_ignored(path):
+    name = os.path.basename(path)
+    if name.startswith('.#') or name.endswith(IGNORE_SUFFIXES) or name.isdigit():
+        return True
+    return any(d in path.split(os.sep) for d in IGNORE_DIRS)
+
 class MyFileSystemEventHander(FileSystemEventHandler):
 
     def __init__(self, fn):
         super(MyFileSystemEventHander, self).__init__()
-        self.restart = fn
+        self.on_changes = fn        #处理一批改动的回调函数：fn(paths)。
+        self._lock = threading.Lock()
+        self._changes = set()
+        self._timer = None
 
     def on_any_event(self, event):
-        if event.src_path.endswith('.py'):
-            log('Python source file changed: %s' % event.src_path)
-            self.restart()
+        if event.is_directory:
+            return
+        #移动(重命名)事件同时记录目标路径；很多编辑器通过“写临时文件再重命名”的方式保存：
+        paths = [event.src_path, getattr(event, 'dest_path', None)]
+        paths = [p for p in paths if p and not is_ignored(p)]
+        if not paths:
+            return
+        with self._lock:
+            self._changes.update(paths)
+            #每次改动都重新计时，窗口内没有新的改动才处理：
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(DEBOUNCE, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            changes = self._changes
+            self._changes = set()
+            self._timer = None
+        if changes:
+            self.on_changes(changes)
+
+#检查Python源文件的语法，返回错误信息列表(已删除的文件跳过)：
+def check_syntax(paths):
+    errors = []
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                compile(f.read(), path, 'exec')
+        except (SyntaxError, ValueError) as e:
+            errors.append('%s: %s' % (path, e))
+    return errors
+
+#按文件类型处理一批改动：
+def handle_changes(paths):
+    sources = sorted(p for p in paths if p.endswith('.py'))
+    templates = sorted(p for p in paths if p.endswith('.html') and os.sep + 'templates' + os.sep in p)
+    statics = sorted(p for p in paths if os.sep + 'static' + os.sep in p)
+    if sources:
+        errors = check_syntax(sources)
+        if errors:
+            #有语法错误时不重启，避免一次错误的保存停掉开发服务器：
+            for err in errors:
+                log('Syntax error, restart skipped: %s' % err)
+        else:
+            log('Python source file changed: %s' % ', '.join(sources))
+            #重启时会重新加载模板，不必再单独处理：
+            reload_process()
+            return
+    if templates:
+        log('Template changed: %s' % ', '.join(templates))
+        reload_templates()
+    if statics:
+        log('Static file changed, no restart needed: %s' % ', '.join(statics))
 
 command = ['echo', 'ok']
 process = None
@@ -31,9 +108,14 @@ process = None
 def kill_process():
     global process
     if process:
-        log('Kill process [%s]...' % process.pid)
-        process.kill()
-        process.wait()
+        log('Stop process [%s]...' % process.pid)
+        #先请求服务器平滑退出，超时再强制结束：
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
         log('Process ended with code %s.' % process.returncode)
         process = None
 
@@ -42,13 +124,25 @@ def start_process():
     log('Start process %s...' % ' '.join(command))
     process = subprocess.Popen(command, stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr)
 
-def restart_process():
-    kill_process()
-    start_process()
+def reload_process():
+    global process
+    #服务器进程仍在运行则通知其平滑重启，否则重新启动：
+    if process and process.poll() is None:
+        log('Reload process [%s]...' % process.pid)
+        process.send_signal(signal.SIGHUP)
+    else:
+        process = None
+        start_process()
+
+#通知服务器进程原地重新加载模板：
+def reload_templates():
+    if process and process.poll() is None:
+        log('Reload templates of process [%s]...' % process.pid)
+        process.send_signal(signal.SIGUSR1)
 
 def start_watch(path, callback):
     observer = Observer()
-    observer.schedule(MyFileSystemEventHander(restart_process), path, recursive=True)
+    observer.schedule(MyFileSystemEventHander(handle_changes), path, recursive=True)
     observer.start()
     log('Watching directory %s...' % path)
     start_process()
@@ -57,6 +151,7 @@ def start_watch(path, callback):
             time.sleep(0.5)
     except KeyboardInterrupt:
         observer.stop()
+        kill_process()
     observer.join()
 
 if __name__ == '__main__':
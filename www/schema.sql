@@ -29,7 +29,9 @@ create table blogs (
     `name` varchar(50) not null,
     `summary` varchar(200) not null,
     `content` mediumtext not null,
+    `comment_count` bigint not null default 0,
     `created_at` real not null,
+    `updated_at` real not null,
     key `idx_created_at` (`created_at`),
     primary key (`id`)
 ) engine=innodb default charset=utf8;
@@ -43,5 +45,13 @@ create table comments (
     `content` mediumtext not null,
     `created_at` real not null,
     key `idx_created_at` (`created_at`),
+    key `idx_blog_id_created_at` (`blog_id`, `created_at`),
     primary key (`id`)
 ) engine=innodb default charset=utf8;
+
+-- upgrade an existing database:
+-- alter table blogs add column `comment_count` bigint not null default 0 after `content`;
+-- alter table comments add key `idx_blog_id_created_at` (`blog_id`, `created_at`);
+-- alter table blogs add column `updated_at` real not null default 0 after `created_at`;
+-- update blogs set `updated_at`=`created_at`;
+-- then fill the counters: python3 jobs.py
@@ -347,6 +347,18 @@ function postJSON(url, data, callback) {
     _httpJSON('POST', url, data, callback);
 }
 
+// batch api calls in one request: requests = [{method: 'GET', url: '/api/blogs?page=1'}, ...],
+// callback(err, responses) with responses[i] = {status: 200, body: {...}} in the same order:
+
+function batchJSON(requests, callback) {
+    _httpJSON('POST', '/api/batch', { requests: requests }, function (err, r) {
+        if (err) {
+            return callback(err);
+        }
+        return callback(null, r.responses);
+    });
+}
+
 // extends Vue:
 
 if (typeof(Vue)!=='undefined') {
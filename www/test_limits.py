@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+limits.py的测试：客户端IP及令牌桶限速。在www目录下运行：python -m unittest test_limits
+'''
+
+import ipaddress, unittest
+
+import limits
+
+TRUSTED = (ipaddress.ip_network('127.0.0.1'), ipaddress.ip_network('10.0.0.0/8'))
+
+class TestClientIP(unittest.TestCase):
+
+    def test_untrusted_peer_ignores_headers(self):
+        headers = {'X-Forwarded-For': '1.2.3.4', 'X-Real-IP': '1.2.3.4'}
+        self.assertEqual(limits.client_ip('8.8.8.8', headers, TRUSTED), '8.8.8.8')
+
+    def test_trusted_peer_uses_forwarded_for(self):
+        self.assertEqual(limits.client_ip('127.0.0.1', {'X-Forwarded-For': '1.2.3.4'}, TRUSTED), '1.2.3.4')
+
+    def test_rightmost_untrusted_address(self):
+        #最左边的地址由客户端伪造，10.0.0.2为内部的另一层代理：
+        headers = {'X-Forwarded-For': '6.6.6.6, 1.2.3.4, 10.0.0.2'}
+        self.assertEqual(limits.client_ip('127.0.0.1', headers, TRUSTED), '1.2.3.4')
+
+    def test_all_trusted_uses_leftmost(self):
+        self.assertEqual(limits.client_ip('127.0.0.1', {'X-Forwarded-For': '10.0.0.3, 10.0.0.2'}, TRUSTED), '10.0.0.3')
+
+    def test_real_ip_without_forwarded_for(self):
+        self.assertEqual(limits.client_ip('127.0.0.1', {'X-Real-IP': '1.2.3.4'}, TRUSTED), '1.2.3.4')
+
+    def test_trusted_peer_without_headers(self):
+        self.assertEqual(limits.client_ip('127.0.0.1', {}, TRUSTED), '127.0.0.1')
+
+    def test_no_trusted_proxies(self):
+        self.assertEqual(limits.client_ip('127.0.0.1', {'X-Forwarded-For': '1.2.3.4'}, ()), '127.0.0.1')
+
+    def test_unparsable_peer(self):
+        self.assertEqual(limits.client_ip(None, {'X-Forwarded-For': '1.2.3.4'}, TRUSTED), None)
+
+class TestRateLimiter(unittest.TestCase):
+
+    def check_no_refund_needed(self, buckets):
+        r = limits.RateLimiter('test', 0.001, 2, buckets)
+        #用户已用完令牌：
+        self.assertEqual(r.take('user:1'), 0)
+        self.assertEqual(r.take('user:1'), 0)
+        #被用户的令牌桶拒绝时，IP的令牌不被扣除：
+        self.assertGreater(r.take('ip:1.2.3.4', 'user:1'), 0)
+        self.assertGreater(r.take('ip:1.2.3.4', 'user:1'), 0)
+        self.assertEqual(r.take('ip:1.2.3.4'), 0)
+        self.assertEqual(r.take('ip:1.2.3.4'), 0)
+        self.assertGreater(r.take('ip:1.2.3.4'), 0)
+        self.assertEqual(r.limited, 3)
+
+    def test_all_or_nothing(self):
+        self.check_no_refund_needed(limits.TokenBuckets(100))
+
+    def test_shared_all_or_nothing(self):
+        self.check_no_refund_needed(limits.SharedTokenBuckets(100))
+
+    def test_shared_falls_back_when_locked(self):
+        buckets = limits.SharedTokenBuckets(100)
+        r = limits.RateLimiter('test', 0.001, 1, buckets)
+        buckets._lock.acquire()
+        try:
+            self.assertEqual(r.take('ip:1.2.3.4'), 0)
+            self.assertGreater(r.take('ip:1.2.3.4'), 0)
+        finally:
+            buckets._lock.release()
+        self.assertEqual(buckets.contended, 2)
+
+    def test_lru_eviction(self):
+        buckets = limits.TokenBuckets(2)
+        for key in ('a', 'b', 'c'):
+            buckets.take([key], 1, 1)
+        self.assertEqual(len(buckets), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+metrics.py的测试：直方图的桶边界。在www目录下运行：python -m unittest test_metrics
+'''
+
+import unittest
+
+import metrics
+
+def bucket_of(seconds):
+    h = metrics.Histogram()
+    h.observe(seconds)
+    return [i for i, n in enumerate(h.counts) if n][0]
+
+class TestHistogram(unittest.TestCase):
+
+    def test_bound_is_inclusive(self):
+        #恰好等于上限的值计入该桶(le="1"包括1秒)：
+        for i, le in enumerate(metrics.BOUNDS):
+            self.assertEqual(bucket_of(le), i, le)
+
+    def test_power_of_two(self):
+        self.assertEqual(metrics.BOUNDS[bucket_of(1.0)], 1.0)
+        self.assertEqual(metrics.BOUNDS[bucket_of(0.5)], 0.5)
+
+    def test_just_above_bound(self):
+        self.assertEqual(metrics.BOUNDS[bucket_of(1.0000001)], 1.25)
+
+    def test_smallest_and_overflow(self):
+        self.assertEqual(bucket_of(0), 0)
+        self.assertEqual(bucket_of(1e-9), 0)
+        self.assertEqual(bucket_of(metrics.BOUNDS[-1]), len(metrics.BOUNDS) - 1)
+        self.assertEqual(bucket_of(metrics.BOUNDS[-1] * 1.01), len(metrics.BOUNDS))
+
+    def test_render_cumulative(self):
+        metrics._histograms.clear()
+        metrics.observe('http_request_duration_seconds', (('route', '/'),), 1.0)
+        text = metrics.render()
+        self.assertIn('http_request_duration_seconds_bucket{route="/",le="1"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="/",le="0.875"} 0', text)
+        metrics._histograms.clear()
+
+if __name__ == '__main__':
+    unittest.main()
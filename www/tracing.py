@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+请求追踪：记录一个请求内各阶段(认证、处理函数、SQL、markdown、模板渲染等)的耗时。
+    - 按比例采样请求；未采样的请求中span()返回同一个空对象，几乎没有开销；
+    - 当前请求及span通过上下文变量传递，并发执行的子任务各自记录到所属的请求；
+    - 完成的请求保存在环形缓冲区，由/api/admin/traces查看；
+    - 采样的请求返回Server-Timing响应头(按span名称汇总)，可在浏览器开发者工具中查看。
+多进程模式下每个工作进程各有一个缓冲区。
+'''
+
+import time, random, itertools, collections, contextvars
+
+_trace = contextvars.ContextVar('trace', default=None)
+_span = contextvars.ContextVar('span', default=None)
+
+#请求：
+class Trace(object):
+    __slots__ = ('id', 'method', 'path', 'status', 'start', 'time', 'duration', 'spans')
+
+    def __init__(self, id, method, path):
+        self.id = id
+        self.method = method
+        self.path = path
+        self.status = None
+        self.start = time.perf_counter()
+        self.time = time.time()
+        self.duration = None
+        self.spans = []
+
+    #按span名称汇总耗时(毫秒)，返回Server-Timing响应头：
+    def server_timing(self):
+        totals = collections.OrderedDict()
+        for s in self.spans:
+            if s.duration is not None:
+                totals[s.name] = totals.get(s.name, 0) + s.duration
+        items = ['%s;dur=%.2f' % (name, d * 1000) for name, d in totals.items()]
+        items.append('total;dur=%.2f' % ((time.perf_counter() - self.start) * 1000))
+        return ', '.join(items)
+
+    def to_dict(self):
+        return dict(
+            id=self.id, method=self.method, path=self.path, status=self.status, time=self.time,
+            duration=round(self.duration * 1000, 3) if self.duration is not None else None,
+            spans=[s.to_dict(self.start) for s in self.spans]
+        )
+
+#请求内的一个阶段；用作with语句：
+class Span(object):
+    __slots__ = ('trace', 'name', 'attrs', 'parent', 'start', 'duration', '_token')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        parent = _span.get()
+        self.parent = parent.name if parent is not None and parent.trace is self.trace else None
+        self._token = _span.set(self)
+        self.trace.spans.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _span.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        return False
+
+    def to_dict(self, start):
+        return dict(name=self.name, parent=self.parent, start=round((self.start - start) * 1000, 3), duration=round(self.duration * 1000, 3) if self.duration is not None else None, **self.attrs)
+
+#未采样请求的span：
+class _NoSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NO_SPAN = _NoSpan()
+
+class Tracer(object):
+    '''
+    Sample requests and keep finished traces in a ring buffer.
+    '''
+
+    def __init__(self, sample=0.0, buffer_size=200):
+        self.sample = sample
+        self.traces = collections.deque(maxlen=buffer_size)
+        self._ids = itertools.count(1)
+
+    def configure(self, sample, buffer_size):
+        self.sample = sample
+        self.traces = collections.deque(self.traces, maxlen=buffer_size)
+
+    #按采样比例开始追踪一个请求；未采样返回(None, None)，否则返回(Trace, token)：
+    def begin(self, method, path):
+        if self.sample <= 0 or (self.sample < 1 and random.random() >= self.sample):
+            return None, None
+        trace = Trace(next(self._ids), method, path)
+        return trace, _trace.set(trace)
+
+    #结束追踪，保存到缓冲区：
+    def end(self, trace, token, status=None):
+        _trace.reset(token)
+        trace.duration = time.perf_counter() - trace.start
+        trace.status = status
+        self.traces.append(trace)
+
+    #返回最近的limit个请求，min_duration(毫秒)只返回耗时不少于该值的请求：
+    def recent(self, limit=50, min_duration=0):
+        r = []
+        for t in reversed(self.traces):
+            if t.duration * 1000 >= min_duration:
+                r.append(t.to_dict())
+                if len(r) >= limit:
+                    break
+        return r
+
+#全局追踪器：由app.create_app()按配置设置：
+tracer = Tracer()
+
+#在当前请求中开始一个span：with span('db', sql=sql): ...；当前请求未采样时返回NO_SPAN：
+def span(name, **attrs):
+    trace = _trace.get()
+    if trace is None:
+        return NO_SPAN
+    return Span(trace, name, attrs)
+
+#返回当前请求的Trace，未采样返回None：
+def current():
+    return _trace.get()